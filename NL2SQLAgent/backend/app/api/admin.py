@@ -0,0 +1,16 @@
+import asyncio
+
+from fastapi import APIRouter, Query
+
+from app.services import index_advisor
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+@router.get("/index-advice")
+async def get_index_advice(
+    top: int | None = Query(None, ge=1, le=100),
+    evaluate: bool = False,
+):
+    """根据已执行 SQL 的工作负载推荐索引；evaluate=true 时在业务库临时副本上测量加速比。"""
+    return await asyncio.to_thread(index_advisor.advise, top, evaluate)
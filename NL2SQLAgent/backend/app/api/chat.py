@@ -1,20 +1,61 @@
+import asyncio
 import json
 import logging
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Iterator
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sse_starlette.sse import EventSourceResponse
 
-from app.models.database import async_session, get_db
+from app.config import settings
+from app.models.database import get_db
 from app.models.schemas import ChatRequest
-from app.services import chart_service, db_service, llm_service, session_service
+from app.services import (
+    chart_service,
+    db_service,
+    llm_service,
+    persistence_queue,
+    session_service,
+)
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
 
+async def _iterate_in_thread(iterator: Iterator[Any]) -> AsyncGenerator[Any, None]:
+    """在线程池中逐项驱动同步迭代器，避免游标读取阻塞事件循环。
+
+    被取消（客户端断开）时线程里的 next() 可能仍在执行，先等它返回再 close，
+    否则 close 会抛出 "generator already executing"；取消本身照常向上传递。
+    """
+    sentinel = object()
+    pending: asyncio.Future | None = None
+    try:
+        while True:
+            pending = asyncio.ensure_future(asyncio.to_thread(next, iterator, sentinel))
+            item = await asyncio.shield(pending)
+            pending = None
+            if item is sentinel:
+                break
+            yield item
+    finally:
+        if pending is not None and not pending.done():
+            try:
+                await asyncio.shield(pending)
+            except Exception:
+                pass
+        await asyncio.to_thread(iterator.close)
+
+
+def _take_chart_result(task: asyncio.Task) -> dict[str, Any] | None:
+    try:
+        return task.result()
+    except Exception as e:
+        logger.warning(f"Chart generation failed: {e}")
+        return None
+
+
 @router.post("/{session_id}")
 async def chat(
     session_id: str,
@@ -25,25 +66,14 @@ async def chat(
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    messages = await session_service.get_messages(db, session_id)
-    llm_service.load_memory_from_messages(session_id, messages)
-
-    user_msg = await session_service.add_message(
-        db, session_id, role="user", content=body.message
-    )
-
-    ai_msg = await session_service.add_message(
-        db, session_id, role="assistant", content=""
-    )
-
-    if session.title == "新对话":
-        new_title = body.message[:30] + ("..." if len(body.message) > 30 else "")
-        from sqlalchemy import update as sql_update
-        from app.models.database import Session as SessionModel
-        await db.execute(
-            sql_update(SessionModel).where(SessionModel.id == session_id).values(title=new_title)
+    if not llm_service.has_memory(session_id, session.updated_at):
+        messages = await session_service.get_recent_messages(
+            db, session_id, settings.memory_window * 2
         )
-        await db.commit()
+        llm_service.load_memory_from_messages(session_id, messages, session.updated_at)
+
+    _, ai_msg = await session_service.start_turn(db, session, body.message)
+    turn_version = session.updated_at
 
     ai_msg_id = ai_msg.id
 
@@ -52,52 +82,105 @@ async def chat(
         generated_sql = ""
         query_result = ""
         chart_config = None
+        chart_task: asyncio.Task | None = None
+        next_chunk: asyncio.Future | None = None
 
         try:
-            generated_sql = llm_service.generate_sql(body.message, session_id)
+            generated_sql = await llm_service.generate_sql(
+                body.message, session_id, use_cache=body.use_cache
+            )
             yield {"event": "sql", "data": generated_sql}
 
             safety_err = db_service.check_sql_safety(generated_sql)
             if safety_err:
+                await llm_service.discard_cached_sql(body.message, session_id)
                 yield {"event": "error", "data": safety_err}
                 yield {"event": "done", "data": ""}
                 return
 
             try:
-                query_result = db_service.execute_sql(generated_sql)
+                if body.stream_rows:
+                    rows_iter = db_service.stream_sql(
+                        generated_sql, use_cache=body.use_cache, fmt=body.result_format
+                    )
+                    async for kind, payload in _iterate_in_thread(rows_iter):
+                        if kind == "result":
+                            query_result = payload
+                        elif kind == "warning":
+                            yield {"event": "warning", "data": payload}
+                        else:
+                            yield {
+                                "event": f"query_result_{kind}",
+                                "data": json.dumps(payload, ensure_ascii=False, default=str),
+                            }
+                else:
+                    warnings: list[str] = []
+                    query_result = await asyncio.to_thread(
+                        db_service.execute_sql,
+                        generated_sql,
+                        body.use_cache,
+                        body.result_format,
+                        warnings,
+                    )
+                    for warning in warnings:
+                        yield {"event": "warning", "data": warning}
+                    yield {"event": "query_result", "data": query_result}
             except ValueError as e:
+                await llm_service.discard_cached_sql(body.message, session_id)
                 yield {"event": "error", "data": str(e)}
                 yield {"event": "done", "data": ""}
                 return
 
-            yield {"event": "query_result", "data": query_result}
+            # 图表只依赖 SQL 与查询结果，与回答流并发生成，哪个先完成先推送
+            chart_task = asyncio.create_task(
+                chart_service.generate_chart_config(generated_sql, query_result)
+            )
+            answer_iter = llm_service.stream_answer(
+                body.message, generated_sql, query_result
+            ).__aiter__()
+            next_chunk = asyncio.ensure_future(answer_iter.__anext__())
+            chart_pending = True
 
             answer_buffer = ""
-            async for chunk_text in llm_service.stream_answer(
-                body.message, generated_sql, query_result
-            ):
-                full_answer += chunk_text
-                answer_buffer += chunk_text
-                while "\n" in answer_buffer:
-                    line, answer_buffer = answer_buffer.split("\n", 1)
-                    yield {"event": "answer", "data": line + "\n"}
+            while True:
+                waiting = {next_chunk, chart_task} if chart_pending else {next_chunk}
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+                if chart_pending and chart_task in done:
+                    chart_pending = False
+                    chart_config = _take_chart_result(chart_task)
+                    if chart_config:
+                        yield {
+                            "event": "chart",
+                            "data": json.dumps(chart_config, ensure_ascii=False),
+                        }
+
+                if next_chunk in done:
+                    try:
+                        chunk_text = next_chunk.result()
+                    except StopAsyncIteration:
+                        break
+                    next_chunk = asyncio.ensure_future(answer_iter.__anext__())
+                    full_answer += chunk_text
+                    answer_buffer += chunk_text
+                    while "\n" in answer_buffer:
+                        line, answer_buffer = answer_buffer.split("\n", 1)
+                        yield {"event": "answer", "data": line + "\n"}
             if answer_buffer:
                 yield {"event": "answer", "data": answer_buffer}
 
-            try:
-                chart_config = chart_service.generate_chart_config(
-                    generated_sql, query_result
-                )
+            if chart_pending:
+                await asyncio.wait({chart_task})
+                chart_pending = False
+                chart_config = _take_chart_result(chart_task)
                 if chart_config:
                     yield {
                         "event": "chart",
                         "data": json.dumps(chart_config, ensure_ascii=False),
                     }
-            except Exception as e:
-                logger.warning(f"Chart generation failed: {e}")
 
             llm_service.add_to_memory(
-                session_id, body.message, generated_sql, full_answer
+                session_id, body.message, generated_sql, full_answer, turn_version
             )
 
         except Exception as e:
@@ -105,16 +188,18 @@ async def chat(
             yield {"event": "error", "data": f"处理出错: {str(e)}"}
 
         finally:
+            for pending in (next_chunk, chart_task):
+                if pending is not None and not pending.done():
+                    pending.cancel()
+
             try:
-                async with async_session() as persist_db:
-                    await session_service.update_message(
-                        persist_db,
-                        ai_msg_id,
-                        content=full_answer,
-                        sql_query=generated_sql,
-                        query_result=query_result,
-                        chart_config=chart_config,
-                    )
+                await persistence_queue.enqueue(
+                    ai_msg_id,
+                    content=full_answer,
+                    sql_query=generated_sql,
+                    query_result=query_result,
+                    chart_config=chart_config,
+                )
             except Exception as e:
                 logger.error(f"Failed to persist message: {e}")
 
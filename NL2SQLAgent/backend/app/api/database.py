@@ -1,4 +1,6 @@
-from fastapi import APIRouter
+import asyncio
+
+from fastapi import APIRouter, BackgroundTasks
 
 from app.models.schemas import ColumnInfo, DatabaseInfoResponse, TableInfo
 from app.services import db_service
@@ -7,13 +9,17 @@ router = APIRouter(prefix="/api/database", tags=["database"])
 
 
 @router.get("/tables", response_model=DatabaseInfoResponse)
-async def get_tables():
-    details = db_service.get_table_details()
+async def get_tables(background_tasks: BackgroundTasks, exact: bool = False):
+    """默认返回估算行数并在后台统计精确行数，后续请求即可直接命中；exact=true 时同步统计。"""
+    details = await asyncio.to_thread(db_service.get_table_details, exact)
+    if any(not t["row_count_exact"] for t in details):
+        background_tasks.add_task(asyncio.to_thread, db_service.refresh_row_counts)
     tables = [
         TableInfo(
             name=t["name"],
             columns=[ColumnInfo(**c) for c in t["columns"]],
             row_count=t["row_count"],
+            row_count_exact=t["row_count_exact"],
             sample_rows=t["sample_rows"],
         )
         for t in details
@@ -21,5 +27,5 @@ async def get_tables():
     return DatabaseInfoResponse(
         dialect="sqlite",
         tables=tables,
-        raw_schema=db_service.get_schema_text(),
+        raw_schema=await asyncio.to_thread(db_service.get_schema_text),
     )
@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+
+from app.services import (
+    chart_service,
+    db_service,
+    llm_service,
+    persistence_queue,
+    result_cache,
+    sql_guard,
+)
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+@router.get("")
+async def get_metrics():
+    return {
+        "sql_generation_cache": llm_service.get_generation_cache_stats(),
+        "conversation_memory": llm_service.get_memory_stats(),
+        "result_cache": result_cache.stats(),
+        "sql_execution": db_service.get_execution_stats(),
+        "sql_guard": sql_guard.stats(),
+        "chart_engine": chart_service.get_chart_stats(),
+        "message_writer": persistence_queue.stats(),
+    }
@@ -1,6 +1,8 @@
 import json
 
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.database import get_db
@@ -8,14 +10,16 @@ from app.models.schemas import (
     MessageResponse,
     SessionCreate,
     SessionDetailResponse,
+    SessionPageResponse,
     SessionResponse,
+    SessionSummaryResponse,
 )
-from app.services import session_service
+from app.services import llm_service, result_format, session_service
 
 router = APIRouter(prefix="/api/sessions", tags=["sessions"])
 
 
-def _msg_to_response(msg) -> MessageResponse:
+def _msg_to_response(msg, fmt: result_format.ResultFormat = "rows") -> MessageResponse:
     chart = None
     if msg.chart_config:
         try:
@@ -28,7 +32,9 @@ def _msg_to_response(msg) -> MessageResponse:
         role=msg.role,
         content=msg.content or "",
         sql_query=msg.sql_query,
-        query_result=msg.query_result,
+        query_result=(
+            result_format.convert(msg.query_result, fmt) if msg.query_result else msg.query_result
+        ),
         chart_config=chart,
         created_at=msg.created_at,
     )
@@ -43,25 +49,68 @@ async def create_session(
     return session
 
 
-@router.get("", response_model=list[SessionResponse])
-async def list_sessions(db: AsyncSession = Depends(get_db)):
-    return await session_service.list_sessions(db)
+@router.get(
+    "",
+    response_model=list[SessionSummaryResponse] | SessionPageResponse,
+    response_model_exclude_none=True,
+)
+async def list_sessions(
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = None,
+    summary: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    """不带 limit 时返回全部会话列表；带 limit 时返回一页，用 next_cursor 作为 cursor 继续翻页。"""
+    if limit is None and not summary:
+        return await session_service.list_sessions(db)
+    try:
+        sessions, next_cursor = await session_service.list_session_page(
+            db, limit, cursor, with_summary=summary
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if limit is None:
+        return sessions
+    return SessionPageResponse(
+        sessions=sessions,
+        has_more=next_cursor is not None,
+        next_cursor=next_cursor,
+    )
 
 
 @router.get("/{session_id}", response_model=SessionDetailResponse)
-async def get_session(session_id: str, db: AsyncSession = Depends(get_db)):
+async def get_session(
+    session_id: str,
+    fmt: Literal["rows", "columnar"] = Query("rows", alias="result_format"),
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    before: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """不带 limit 时返回全部消息；带 limit 时返回最新一页，用 next_cursor 作为 before 继续向前翻页。"""
     session = await session_service.get_session(db, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    messages = await session_service.get_messages(db, session_id)
+    next_cursor = None
+    if limit is None:
+        messages = await session_service.get_messages(db, session_id)
+    else:
+        try:
+            messages, next_cursor = await session_service.get_message_page(
+                db, session_id, limit, before
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     return SessionDetailResponse(
         session=SessionResponse.model_validate(session),
-        messages=[_msg_to_response(m) for m in messages],
+        messages=[_msg_to_response(m, fmt) for m in messages],
+        has_more=next_cursor is not None,
+        next_cursor=next_cursor,
     )
 
 
 @router.delete("/{session_id}", status_code=204)
 async def delete_session(session_id: str, db: AsyncSession = Depends(get_db)):
     deleted = await session_service.delete_session(db, session_id)
+    llm_service.forget_memory(session_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Literal
 from pydantic_settings import BaseSettings
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -10,14 +11,100 @@ class Settings(BaseSettings):
 
     dashscope_api_key: str = ""
     llm_model_name: str = "qwen3-max"
+    # DashScope SDK 为同步实现，LLM / SQL 调用均在该线程池中执行
+    executor_max_workers: int = 64
+    # DashScope HTTP 连接池：keep-alive 连接数上限
+    llm_pool_connections: int = 4
+    llm_pool_size: int = 32
 
     app_db_url: str = f"sqlite+aiosqlite:///{BASE_DIR / 'data' / 'app.db'}"
+    # app.db 引擎：SQL 日志独立于 debug；连接建立时设置 WAL / synchronous / busy_timeout
+    app_db_echo: bool = False
+    app_db_journal_mode: Literal["DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"] = "WAL"
+    app_db_synchronous: Literal["OFF", "NORMAL", "FULL", "EXTRA"] = "NORMAL"
+    app_db_busy_timeout_ms: int = 5000
+    app_db_pool_size: int = 5
+    app_db_max_overflow: int = 10
+    app_db_pool_timeout: float = 30.0
     sample_db_path: str = str(BASE_DIR / "data" / "sample.db")
     sample_db_uri: str = f"sqlite:///{BASE_DIR / 'data' / 'sample.db'}"
 
     sql_max_rows: int = 500
     sql_timeout: int = 10
+    # 单条查询的 VM 指令预算，progress handler 每 sql_progress_interval 条指令检查一次
+    sql_max_vm_steps: int = 500_000_000
+    sql_progress_interval: int = 10_000
+    # 执行前用 EXPLAIN QUERY PLAN 结合表行数估算扫描量：超过 warn 提示，超过 max 拒绝执行
+    sql_cost_guard_enabled: bool = True
+    sql_cost_warn_rows: int = 1_000_000
+    sql_cost_max_rows: int = 100_000_000
+    # 流式返回查询结果时每个 query_result_rows 事件的行数
+    sql_stream_batch_size: int = 100
+    # 查询结果在入库与注入 prompt 时使用的编码：rows（对象数组）/ columnar（列式）
+    result_storage_format: Literal["rows", "columnar"] = "columnar"
+    prompt_result_format: Literal["rows", "columnar"] = "columnar"
+    # 结果同时超过以下行数与字符数时，回答 prompt 改用统计摘要
+    digest_min_rows: int = 50
+    digest_min_chars: int = 4000
+    digest_top_k: int = 5
+    digest_sample_rows: int = 5
+    digest_max_trends: int = 3
+
+    # 图表引擎：rules 仅规则 / llm 仅模型 / hybrid 规则优先，无法判断时回退模型
+    chart_engine: Literal["rules", "llm", "hybrid"] = "hybrid"
+    # 图表 prompt 中附带的示例行数
+    chart_prompt_sample_rows: int = 5
+    # 业务库只读连接池
+    sql_pool_size: int = 8
+    sql_pool_mmap_bytes: int = 256 * 1024 * 1024
+    sql_pool_page_cache_kib: int = 64 * 1024
     memory_window: int = 10
+    # 进程内会话记忆上限，超出后按 LRU 淘汰
+    memory_max_sessions: int = 1000
+    memory_max_bytes: int = 32 * 1024 * 1024
+    # 会话列表摘要中最后一条消息的预览长度（字符）
+    session_preview_chars: int = 80
+    # 助手消息写回队列：队列上限、单批合并条数、凑批等待时间（秒），
+    # 以及整批写入失败后的重试次数与重试间隔（秒）
+    persist_queue_size: int = 1000
+    persist_batch_size: int = 50
+    persist_batch_wait: float = 0.05
+    persist_retries: int = 2
+    persist_retry_delay: float = 0.5
+
+    # 相关表检索：表数量达到阈值后，NL→SQL prompt 只注入 top-k 相关表及其外键邻居
+    schema_retrieval_min_tables: int = 20
+    schema_retrieval_top_k: int = 5
+    schema_index_sample_values: int = 20
+    schema_index_path: str = str(BASE_DIR / "data" / "schema_index.json")
+    # NL→SQL prompt 中的 Schema 格式：ddl（建表语句 + 示例行）/ compact（每表一行）
+    schema_prompt_format: Literal["ddl", "compact"] = "ddl"
+    # compact 格式下，取值个数不超过该值的文本列会列出全部取值
+    schema_compact_max_distinct: int = 10
+
+    # NL→SQL 生成缓存
+    sql_cache_enabled: bool = True
+    sql_cache_size: int = 1024
+    sql_cache_ttl: float = 3600
+    # SQL 安全校验结论缓存（按指纹）
+    sql_guard_cache_size: int = 4096
+
+    # 查询结果缓存：内存层按字节限额，磁盘层为本地 SQLite 文件
+    result_cache_enabled: bool = True
+    result_cache_max_entries: int = 2048
+    result_cache_memory_bytes: int = 64 * 1024 * 1024
+    result_cache_disk_enabled: bool = True
+    result_cache_disk_max_entries: int = 20000
+    result_cache_path: str = str(BASE_DIR / "data" / "result_cache.db")
+
+    # 索引建议：记录已执行 SQL 的工作负载，本进程记住已抓取执行计划的指纹数，
+    # 推荐索引时覆盖索引最多包含的列数，验证时每条查询的重复次数
+    index_advisor_enabled: bool = True
+    index_advisor_path: str = str(BASE_DIR / "data" / "workload.db")
+    index_advisor_planned_size: int = 5000
+    index_advisor_max_columns: int = 5
+    index_advisor_top_k: int = 10
+    index_advisor_repeat: int = 3
 
     cors_origins: list[str] = [
         "http://localhost:5173",
@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
@@ -5,12 +7,26 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import settings
 from app.models.database import init_db
+from app.services import persistence_queue
+from app.services.db_service import close_connection_pool
+from app.services.llm_client import close_llm_clients, init_llm_clients
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    executor = ThreadPoolExecutor(
+        max_workers=settings.executor_max_workers,
+        thread_name_prefix="nl2sql-worker",
+    )
+    asyncio.get_running_loop().set_default_executor(executor)
     await init_db()
+    init_llm_clients()
+    persistence_queue.start()
     yield
+    await persistence_queue.stop()
+    close_llm_clients()
+    close_connection_pool()
+    executor.shutdown(wait=False, cancel_futures=True)
 
 
 app = FastAPI(
@@ -29,10 +45,14 @@ app.add_middleware(
 from app.api.sessions import router as sessions_router
 from app.api.database import router as database_router
 from app.api.chat import router as chat_router
+from app.api.metrics import router as metrics_router
+from app.api.admin import router as admin_router
 
 app.include_router(sessions_router)
 app.include_router(database_router)
 app.include_router(chat_router)
+app.include_router(metrics_router)
+app.include_router(admin_router)
 
 
 @app.get("/health")
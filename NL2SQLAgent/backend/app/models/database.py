@@ -1,13 +1,31 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, ForeignKey, String, Text
+from sqlalchemy import Column, DateTime, ForeignKey, Index, String, Text, event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 
 from app.config import settings
 
-engine = create_async_engine(settings.app_db_url, echo=settings.debug)
+engine = create_async_engine(
+    settings.app_db_url,
+    echo=settings.app_db_echo,
+    pool_size=settings.app_db_pool_size,
+    max_overflow=settings.app_db_max_overflow,
+    pool_timeout=settings.app_db_pool_timeout,
+)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _configure_sqlite(dbapi_conn, _record) -> None:
+    """每个新连接设置 WAL 与写入参数，读请求不再被写事务阻塞。"""
+    cursor = dbapi_conn.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.app_db_journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={settings.app_db_synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={settings.app_db_busy_timeout_ms}")
+    cursor.close()
+
+
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
@@ -27,6 +45,11 @@ class Session(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # 会话列表按最近更新时间分页
+        Index("ix_sessions_updated", "updated_at", "id"),
+    )
+
 
 class Message(Base):
     __tablename__ = "messages"
@@ -40,10 +63,23 @@ class Message(Base):
     chart_config = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # 会话内按时间分页读取历史
+        Index("ix_messages_session_created", "session_id", "created_at", "id"),
+    )
+
+
+def _create_missing_indexes(sync_conn) -> None:
+    """create_all 不会为已存在的表补建索引，旧库升级时在此补齐。"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
 
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
 
 
 async def get_db() -> AsyncSession:
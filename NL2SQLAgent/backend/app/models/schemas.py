@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Any, Optional
+from typing import Any, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -19,6 +19,19 @@ class SessionResponse(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class SessionSummaryResponse(SessionResponse):
+    # 仅在 GET /api/sessions?summary=true 时返回
+    message_count: Optional[int] = None
+    last_message_preview: Optional[str] = None
+
+
+class SessionPageResponse(BaseModel):
+    # GET /api/sessions?limit=N 的响应，翻页方式与消息分页一致
+    sessions: list[SessionSummaryResponse]
+    has_more: bool = False
+    next_cursor: Optional[str] = None
+
+
 # ---------- Message ----------
 
 class MessageResponse(BaseModel):
@@ -37,12 +50,18 @@ class MessageResponse(BaseModel):
 class SessionDetailResponse(BaseModel):
     session: SessionResponse
     messages: list[MessageResponse]
+    # 仅在请求带 limit 分页时有意义：是否还有更早的消息及其游标
+    has_more: bool = False
+    next_cursor: Optional[str] = None
 
 
 # ---------- Chat ----------
 
 class ChatRequest(BaseModel):
     message: str = Field(..., min_length=1, max_length=2000)
+    use_cache: bool = True
+    stream_rows: bool = False
+    result_format: Literal["rows", "columnar"] = "rows"
 
 
 # ---------- Chart ----------
@@ -64,6 +83,8 @@ class TableInfo(BaseModel):
     name: str
     columns: list[ColumnInfo]
     row_count: int = 0
+    # False 表示行数来自 sqlite_stat1 / max(rowid) 估算
+    row_count_exact: bool = True
     sample_rows: list[dict[str, Any]] = Field(default_factory=list)
 
 
@@ -1,12 +1,16 @@
-CHART_GEN_TEMPLATE = """你是一个数据可视化专家。根据 SQL 查询和查询结果，判断是否适合生成图表，并生成 ECharts 配置。
+CHART_GEN_TEMPLATE = """你是一个数据可视化专家。根据 SQL 查询和查询结果的列信息，判断是否适合生成图表，并选择图表类型与字段映射。
+图表数据由系统根据完整查询结果自动填充，你只需要给出字段映射，不要输出任何数据点。
 
 ## SQL 查询
 ```sql
 {sql}
 ```
 
-## 查询结果
-{result}
+## 查询结果概况
+共 {row_count} 行
+列（列名: 类型）: {columns}
+前 {sample_size} 行示例:
+{sample}
 
 ## 规则
 1. 根据数据特征选择最合适的图表类型:
@@ -16,12 +20,16 @@ CHART_GEN_TEMPLATE = """你是一个数据可视化专家。根据 SQL 查询和
    - scatter (散点图): 适合两个数值变量的关系
    - table (表格): 当数据不适合可视化时使用
 2. 如果查询结果只有 1 行或数据不适合图表，chart_type 设为 "table"
-3. 生成的 ECharts option 必须是合法 JSON
-4. 图表标题用中文
+3. x 为横轴 / 分类 / 饼图名称所用的列名；y 为数值列名数组（饼图、散点图只取第一个）
+4. 若需按某一列的取值拆分为多条序列（如按地区分组的月度趋势），series 填该列名，否则为 null
+5. 字段名必须与上面列出的列名完全一致
+6. 图表标题用中文
 
 ## 请输出严格的 JSON 格式（不要添加 markdown 代码块标记）:
 {{
   "chart_type": "bar|line|pie|scatter|table",
   "title": "图表标题",
-  "option": {{ ... ECharts option 配置 ... }}
+  "x": "列名",
+  "y": ["数值列名"],
+  "series": null
 }}"""
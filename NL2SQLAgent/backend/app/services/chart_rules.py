@@ -0,0 +1,167 @@
+"""规则图表推荐：根据结果列类型与基数直接生成 ECharts 配置，明确的形状无需调用 LLM。"""
+from __future__ import annotations
+
+import re
+from typing import Any, Sequence
+
+from app.services import result_format
+
+MAX_CATEGORIES = 30
+MAX_PIE_SLICES = 8
+MAX_SERIES = 4
+
+_DATE_VALUE = re.compile(r"^\d{4}[-/]\d{1,2}([-/]\d{1,2})?([ T]\d{1,2}:\d{2}(:\d{2})?)?$")
+_YEAR_VALUE = re.compile(r"^\d{4}$")
+# 只匹配完整的名称片段，避免「日均销量」「purchase_times」之类的度量列被当作时间
+_DATE_NAME = re.compile(
+    r"(^|_)(date|day|week|month|year)(_|$)|^(日期|月份|年份|时间)$", re.IGNORECASE
+)
+_ID_NAME = re.compile(r"(^id$|_id$)", re.IGNORECASE)
+_SHARE_NAME = re.compile(r"(ratio|percent|share|pct|占比|比例|份额|百分比)", re.IGNORECASE)
+
+
+def _is_temporal(name: str, col_type: str, values: Sequence[Any]) -> bool:
+    date_name = bool(_DATE_NAME.search(name))
+    if col_type == "text":
+        samples = [v for v in values if v is not None][:20]
+        # 纯四位数字（如 sku "1001"）仅在列名也表明是年份 / 日期时视为时间
+        return bool(samples) and all(
+            _DATE_VALUE.match(str(v)) or (date_name and _YEAR_VALUE.match(str(v)))
+            for v in samples
+        )
+    return col_type == "integer" and date_name
+
+
+def classify_columns(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> dict[str, list[str]]:
+    """把列分为 temporal / numeric / category 三类，id 类整数列不参与度量。"""
+    types = result_format.infer_column_types(columns, rows)
+    groups: dict[str, list[str]] = {"temporal": [], "numeric": [], "category": []}
+    for i, (name, col_type) in enumerate(zip(columns, types)):
+        values = [row[i] for row in rows]
+        if _is_temporal(name, col_type, values):
+            groups["temporal"].append(name)
+        elif col_type in ("integer", "real") and not _ID_NAME.search(name):
+            groups["numeric"].append(name)
+        elif col_type != "null":
+            groups["category"].append(name)
+    return groups
+
+
+def build_option(
+    chart_type: str,
+    columns: Sequence[str],
+    rows: Sequence[Sequence[Any]],
+    x: str | None,
+    y: Sequence[str],
+    series: str | None = None,
+) -> dict[str, Any]:
+    """用真实结果行填充 ECharts option。series 列存在时按其取值拆分为多条序列。"""
+    index = {name: i for i, name in enumerate(columns)}
+    ys = [name for name in y if name in index][:MAX_SERIES]
+    if chart_type == "table" or x not in index or not ys:
+        return {}
+
+    xi = index[x]
+    if chart_type == "pie":
+        yi = index[ys[0]]
+        return {
+            "tooltip": {"trigger": "item"},
+            "legend": {"type": "scroll", "bottom": 0},
+            "series": [{
+                "name": ys[0],
+                "type": "pie",
+                "radius": "60%",
+                "data": [{"name": str(row[xi]), "value": row[yi]} for row in rows],
+            }],
+        }
+
+    if chart_type == "scatter":
+        yi = index[ys[0]]
+        return {
+            "tooltip": {"trigger": "item"},
+            "xAxis": {"type": "value", "name": x, "scale": True},
+            "yAxis": {"type": "value", "name": ys[0], "scale": True},
+            "series": [{
+                "name": ys[0],
+                "type": "scatter",
+                "data": [[row[xi], row[yi]] for row in rows],
+            }],
+        }
+
+    categories = list(dict.fromkeys(str(row[xi]) for row in rows))
+    if series in index and series != x:
+        si, yi = index[series], index[ys[0]]
+        grouped: dict[str, dict[str, Any]] = {}
+        for row in rows:
+            grouped.setdefault(str(row[si]), {})[str(row[xi])] = row[yi]
+        chart_series = [
+            {"name": name, "type": chart_type, "data": [values.get(c) for c in categories]}
+            for name, values in grouped.items()
+        ]
+    else:
+        chart_series = [
+            {"name": name, "type": chart_type, "data": [row[index[name]] for row in rows]}
+            for name in ys
+        ]
+        if len(categories) != len(rows):
+            categories = [str(row[xi]) for row in rows]
+
+    option: dict[str, Any] = {
+        "tooltip": {"trigger": "axis"},
+        "xAxis": {"type": "category", "data": categories},
+        "yAxis": {"type": "value"},
+        "series": chart_series,
+    }
+    if len(chart_series) > 1:
+        option["legend"] = {"data": [s["name"] for s in chart_series]}
+    return option
+
+
+def recommend_chart(query_result: str) -> dict[str, Any] | None:
+    """为形状明确的结果返回图表配置；无法可靠判断时返回 None 交由 LLM 处理。"""
+    columns, rows = result_format.decode(query_result)
+    if len(rows) <= 1:
+        return {"chartType": "table", "title": "", "option": {}}
+
+    groups = classify_columns(columns, rows)
+    temporal, numeric, category = groups["temporal"], groups["numeric"], groups["category"]
+
+    if len(temporal) == 1 and numeric and not category and len(numeric) <= MAX_SERIES:
+        x = temporal[0]
+        title = f"{'、'.join(numeric)}随{x}变化趋势"
+        return _chart("line", title, columns, rows, x, numeric)
+
+    if len(category) == 1 and numeric and not temporal and len(numeric) <= MAX_SERIES:
+        x = category[0]
+        if len(rows) > MAX_CATEGORIES:
+            return None
+        values = [row[columns.index(numeric[0])] for row in rows]
+        if (
+            len(numeric) == 1
+            and len(rows) <= MAX_PIE_SLICES
+            and _SHARE_NAME.search(numeric[0])
+            and all(v is not None and v >= 0 for v in values)
+        ):
+            return _chart("pie", f"{numeric[0]}按{x}分布", columns, rows, x, numeric)
+        return _chart("bar", f"各{x}的{'、'.join(numeric)}", columns, rows, x, numeric)
+
+    if not temporal and not category and len(numeric) == 2:
+        x, y = numeric
+        return _chart("scatter", f"{x}与{y}的关系", columns, rows, x, [y])
+
+    return None
+
+
+def _chart(
+    chart_type: str,
+    title: str,
+    columns: Sequence[str],
+    rows: Sequence[Sequence[Any]],
+    x: str,
+    y: Sequence[str],
+) -> dict[str, Any]:
+    return {
+        "chartType": chart_type,
+        "title": title,
+        "option": build_option(chart_type, columns, rows, x, y),
+    }
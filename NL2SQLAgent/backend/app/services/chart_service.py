@@ -1,19 +1,23 @@
-"""图表生成服务：LLM 驱动的图表类型推荐 + ECharts option JSON 生成。"""
+"""图表生成服务：规则推荐 / LLM 选择图表类型与字段映射，ECharts option 由后端用真实数据填充。"""
 from __future__ import annotations
 
 import json
 import re
 from typing import Any
 
-from langchain_community.chat_models.tongyi import ChatTongyi
 from langchain_core.messages import HumanMessage
 
 from app.config import settings
 from app.prompts.chart_gen import CHART_GEN_TEMPLATE
+from app.services import result_format
+from app.services.chart_rules import build_option, recommend_chart
+from app.services.llm_client import get_llm
 
+_chart_stats = {"rules": 0, "llm": 0}
 
-def _get_llm() -> ChatTongyi:
-    return ChatTongyi(model=settings.llm_model_name, temperature=0)
+
+def get_chart_stats() -> dict[str, int]:
+    return dict(_chart_stats)
 
 
 def _extract_json(text: str) -> dict[str, Any] | None:
@@ -35,11 +39,43 @@ def _extract_json(text: str) -> dict[str, Any] | None:
     return None
 
 
-def generate_chart_config(sql: str, query_result: str) -> dict[str, Any] | None:
-    """根据 SQL 和查询结果生成 ECharts 图表配置。"""
-    llm = _get_llm()
-    prompt_text = CHART_GEN_TEMPLATE.format(sql=sql, result=query_result)
-    response = llm.invoke([HumanMessage(content=prompt_text)])
+async def generate_chart_config(sql: str, query_result: str) -> dict[str, Any] | None:
+    """根据 SQL 和查询结果生成 ECharts 图表配置。
+
+    chart_engine 为 rules 时只用规则推荐（无法判断时退化为表格），
+    llm 时总是调用模型，hybrid 时规则无法判断才调用模型。
+    """
+    if settings.chart_engine in ("rules", "hybrid"):
+        chart = recommend_chart(query_result)
+        if chart is not None or settings.chart_engine == "rules":
+            _chart_stats["rules"] += 1
+            return chart or {"chartType": "table", "title": "", "option": {}}
+    _chart_stats["llm"] += 1
+    return await _generate_with_llm(sql, query_result)
+
+
+def _single_field(value: Any) -> str | None:
+    """LLM 偶尔把单个字段写成 ["month"]：单元素列表取出其中的字符串，其它非字符串值丢弃。"""
+    if isinstance(value, list) and len(value) == 1:
+        value = value[0]
+    return value if isinstance(value, str) else None
+
+
+async def _generate_with_llm(sql: str, query_result: str) -> dict[str, Any] | None:
+    """LLM 只决定图表类型、标题与字段映射，prompt 与输出长度不随结果行数增长。"""
+    columns, rows = result_format.decode(query_result)
+    types = result_format.infer_column_types(columns, rows)
+    sample = rows[: settings.chart_prompt_sample_rows]
+
+    llm = get_llm()
+    prompt_text = CHART_GEN_TEMPLATE.format(
+        sql=sql,
+        row_count=len(rows),
+        columns=", ".join(f"{c}: {t}" for c, t in zip(columns, types)),
+        sample_size=len(sample),
+        sample=result_format.encode(columns, sample, settings.prompt_result_format, types),
+    )
+    response = await llm.ainvoke([HumanMessage(content=prompt_text)])
 
     chart_data = _extract_json(response.content)
     if not chart_data:
@@ -49,8 +85,23 @@ def generate_chart_config(sql: str, query_result: str) -> dict[str, Any] | None:
     if chart_type not in ("bar", "line", "pie", "scatter", "table"):
         chart_type = "table"
 
+    y = chart_data.get("y") or []
+    if isinstance(y, str):
+        y = [y]
+    y = [name for name in y if isinstance(name, str)] if isinstance(y, list) else []
+    option = build_option(
+        chart_type,
+        columns,
+        rows,
+        _single_field(chart_data.get("x")),
+        y,
+        _single_field(chart_data.get("series")),
+    )
+    if not option:
+        chart_type = "table"
+
     return {
         "chartType": chart_type,
         "title": chart_data.get("title", ""),
-        "option": chart_data.get("option", {}),
+        "option": option,
     }
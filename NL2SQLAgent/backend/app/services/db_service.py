@@ -1,23 +1,91 @@
 """业务数据库服务：Schema 自省、SQL 安全检查、SQL 执行沙箱。"""
 from __future__ import annotations
 
-import json
+import hashlib
+import logging
+import os
+import queue
 import re
 import sqlite3
-from typing import Any
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Literal, TypeVar
 
 from langchain_community.utilities import SQLDatabase
 
 from app.config import settings
+from app.services import index_advisor, result_cache, result_format, sql_guard
+from app.services.result_format import ResultFormat, infer_column_types
+
+logger = logging.getLogger(__name__)
 
 _sql_db: SQLDatabase | None = None
 
-DANGEROUS_KEYWORDS = re.compile(
-    r"\b(DROP|DELETE|UPDATE|INSERT|ALTER|CREATE|TRUNCATE|REPLACE|GRANT|REVOKE)\b",
-    re.IGNORECASE,
+T = TypeVar("T")
+
+SchemaFormat = Literal["ddl", "compact"]
+
+_COMPACT_SCHEMA_LEGEND = "-- 格式: 表名(列名 类型 [PK] [FK→引用表.列] [{该列全部取值}])"
+
+# Schema 缓存：仅在 PRAGMA schema_version 或文件 mtime 变化时重建
+_schema_cache: dict[str, Any] = {}
+_schema_lock = threading.RLock()
+
+# 只读连接池：复用连接以保留页缓存与预编译语句；库文件被替换（inode 变化）时整体重建。
+# _conn_inodes 记录每个连接打开时的 inode，借出期间文件被替换的连接归还时直接关闭
+_pool: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+_pool_created = 0
+_pool_inode: int | None = None
+_conn_inodes: dict[sqlite3.Connection, int] = {}
+_pool_lock = threading.Lock()
+
+# 精确行数缓存：按数据版本失效，由后台任务或 exact=true 请求刷新
+_row_counts: dict[str, Any] = {"version": None, "counts": {}}
+_row_count_lock = threading.Lock()
+
+# 执行预算触发次数
+_execution_stats = {
+    "timeouts": 0,
+    "step_budget_exceeded": 0,
+    "cost_rejected": 0,
+    "cost_warnings": 0,
+    "limit_injected": 0,
+}
+
+# EXPLAIN QUERY PLAN 中的循环步骤：SCAN / SEARCH <表或别名> ...
+_PLAN_LOOP_RE = re.compile(r"^(SCAN|SEARCH) (?:TABLE )?(\S+)(?: AS (\S+))?(.*)$")
+
+# SQLite 关键字，规范化缓存键中外层 FROM 之后的部分时统一大写
+_SQL_KEYWORDS = frozenset("""
+    ABORT ACTION ADD AFTER ALL ALTER ALWAYS ANALYZE AND AS ASC ATTACH AUTOINCREMENT BEFORE
+    BEGIN BETWEEN BY CASCADE CASE CAST CHECK COLLATE COLUMN COMMIT CONFLICT CONSTRAINT CREATE
+    CROSS CURRENT CURRENT_DATE CURRENT_TIME CURRENT_TIMESTAMP DATABASE DEFAULT DEFERRABLE
+    DEFERRED DELETE DESC DETACH DISTINCT DO DROP EACH ELSE END ESCAPE EXCEPT EXCLUDE EXCLUSIVE
+    EXISTS EXPLAIN FAIL FILTER FIRST FOLLOWING FOR FOREIGN FROM FULL GENERATED GLOB GROUP
+    GROUPS HAVING IF IGNORE IMMEDIATE IN INDEX INDEXED INITIALLY INNER INSERT INSTEAD
+    INTERSECT INTO IS ISNULL JOIN KEY LAST LEFT LIKE LIMIT MATCH MATERIALIZED NATURAL NO NOT
+    NOTHING NOTNULL NULL NULLS OF OFFSET ON OR ORDER OTHERS OUTER OVER PARTITION PLAN PRAGMA
+    PRECEDING PRIMARY QUERY RAISE RANGE RECURSIVE REFERENCES REGEXP REINDEX RELEASE RENAME
+    REPLACE RESTRICT RETURNING RIGHT ROLLBACK ROW ROWS SAVEPOINT SELECT SET TABLE TEMP
+    TEMPORARY THEN TIES TO TRANSACTION TRIGGER UNBOUNDED UNION UNIQUE UPDATE USING VACUUM
+    VALUES VIEW VIRTUAL WHEN WHERE WINDOW WITH WITHOUT
+""".split())
+
+# 字符串 / 引号标识符原样保留，注释与连续空白折叠为单个空格
+_SQL_CANONICAL_RE = re.compile(
+    r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])|((?:\s+|--[^\n]*|/\*[\s\S]*?\*/)+)"""
 )
 
 
+class SQLTimeoutError(ValueError):
+    """SQL 执行超出墙钟时间或 VM 指令预算。"""
+
+
+class SQLCostError(ValueError):
+    """执行计划估算的扫描行数超出 sql_cost_max_rows。"""
+
+
 def get_sql_database() -> SQLDatabase:
     global _sql_db
     if _sql_db is None:
@@ -25,32 +93,246 @@ def get_sql_database() -> SQLDatabase:
     return _sql_db
 
 
+def _open_readonly_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        f"file:{settings.sample_db_path}?mode=ro",
+        uri=True,
+        timeout=settings.sql_timeout,
+        check_same_thread=False,
+    )
+    conn.execute(f"PRAGMA mmap_size={int(settings.sql_pool_mmap_bytes)}")
+    conn.execute(f"PRAGMA cache_size={-int(settings.sql_pool_page_cache_kib)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+def _drain_pool() -> None:
+    global _pool_created
+    while True:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            break
+        _conn_inodes.pop(conn, None)
+        conn.close()
+        _pool_created -= 1
+
+
+def _acquire_connection() -> sqlite3.Connection:
+    global _pool_created, _pool_inode
+    inode = os.stat(settings.sample_db_path).st_ino
+    with _pool_lock:
+        if inode != _pool_inode:
+            _drain_pool()
+            _pool_inode = inode
+        try:
+            return _pool.get_nowait()
+        except queue.Empty:
+            pass
+        if _pool_created < settings.sql_pool_size:
+            conn = _open_readonly_connection()
+            _conn_inodes[conn] = inode
+            _pool_created += 1
+            return conn
+    try:
+        return _pool.get(timeout=settings.sql_timeout)
+    except queue.Empty:
+        raise ValueError("数据库连接繁忙，请稍后重试")
+
+
+def _release_connection(conn: sqlite3.Connection) -> None:
+    global _pool_created
+    inode = os.stat(settings.sample_db_path).st_ino
+    with _pool_lock:
+        if _conn_inodes.get(conn) == _pool_inode == inode:
+            _pool.put(conn)
+            return
+        _conn_inodes.pop(conn, None)
+        _pool_created -= 1
+    conn.close()
+
+
+@contextmanager
+def readonly_connection() -> Iterator[sqlite3.Connection]:
+    """从连接池借出一个只读连接，用完自动归还。"""
+    conn = _acquire_connection()
+    try:
+        yield conn
+    finally:
+        _release_connection(conn)
+
+
+def close_connection_pool() -> None:
+    with _pool_lock:
+        _drain_pool()
+
+
+def get_schema_version() -> tuple[int, int]:
+    """返回 (PRAGMA schema_version, 文件 mtime_ns)，任一变化即视为 Schema 缓存失效。"""
+    with readonly_connection() as conn:
+        schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    return schema_version, os.stat(settings.sample_db_path).st_mtime_ns
+
+
+def get_data_version() -> str:
+    """返回业务库数据版本标识。
+
+    PRAGMA data_version 只在同一连接内可比，无法跨进程共享，因此这里
+    用主库与 WAL 文件的 (mtime_ns, size) 组合作为全局版本号。
+    """
+    parts = []
+    for path in (settings.sample_db_path, settings.sample_db_path + "-wal"):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        parts.append(f"{st.st_mtime_ns}:{st.st_size}")
+    return "/".join(parts)
+
+
+def _get_schema_cached(key: str, builder: Callable[[], T]) -> T:
+    global _sql_db
+    version = get_schema_version()
+    with _schema_lock:
+        if _schema_cache.get("version") != version:
+            _schema_cache.clear()
+            _schema_cache["version"] = version
+            _sql_db = None  # SQLDatabase 在构造时反射表结构，需随 Schema 一起重建
+        if key not in _schema_cache:
+            _schema_cache[key] = builder()
+        return _schema_cache[key]
+
+
 def get_table_names() -> list[str]:
     db = get_sql_database()
     return list(db.get_usable_table_names())
 
 
-def get_schema_text() -> str:
-    """返回完整的 DDL + 示例数据文本，用于注入 LLM prompt。"""
-    db = get_sql_database()
-    return db.get_table_info()
+def get_schema_text(
+    table_names: list[str] | None = None,
+    fmt: SchemaFormat = "ddl",
+) -> str:
+    """返回用于注入 LLM prompt 的 Schema 文本。table_names 为空时包含全部表。
+
+    fmt="ddl" 为 LangChain 的 CREATE TABLE + 示例行，fmt="compact" 为每表一行的紧凑格式。
+    """
+    if fmt == "compact":
+        names = table_names if table_names is not None else _get_schema_cached(
+            "table_names", _list_tables
+        )
+        lines = [_COMPACT_SCHEMA_LEGEND]
+        lines += [
+            _get_schema_cached(f"compact:{name}", lambda name=name: _render_compact_table(name))
+            for name in names
+        ]
+        return "\n".join(lines)
+    if table_names is None:
+        return _get_schema_cached("text", lambda: get_sql_database().get_table_info())
+    return "\n\n".join(
+        _get_schema_cached(
+            f"table:{name}", lambda name=name: get_sql_database().get_table_info([name])
+        )
+        for name in table_names
+    )
 
 
-def get_table_details() -> list[dict[str, Any]]:
-    """返回结构化的表信息，用于 API 响应。"""
-    conn = sqlite3.connect(settings.sample_db_path)
-    conn.row_factory = sqlite3.Row
-    try:
+def _list_tables() -> list[str]:
+    with readonly_connection() as conn:
+        rows = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        ).fetchall()
+    return [r[0] for r in rows]
+
+
+def _render_compact_table(table_name: str) -> str:
+    """渲染一行表结构，如：
+
+    orders(id INTEGER PK, customer_id INTEGER FK→customers.id, region TEXT {华东|华南}, ...)
+    低基数文本列附带全部取值，便于模型写出准确的过滤条件。
+    """
+    max_distinct = settings.schema_compact_max_distinct
+    with readonly_connection() as conn:
+        foreign_keys = {}
+        for _id, seq, ref_table, from_col, to_col, *_ in conn.execute(
+            f"PRAGMA foreign_key_list('{table_name}')"
+        ).fetchall():
+            if to_col is None:
+                # 未写目标列时引用父表主键（复合主键按 seq 对应）
+                ref_pk = [
+                    c[1] for c in sorted(
+                        (c for c in conn.execute(f"PRAGMA table_info('{ref_table}')") if c[5]),
+                        key=lambda c: c[5],
+                    )
+                ]
+                to_col = ref_pk[seq] if seq < len(ref_pk) else None
+            foreign_keys[from_col] = f"{ref_table}.{to_col}" if to_col else ref_table
+        parts = []
+        for _cid, col_name, col_type, _notnull, _default, pk in conn.execute(
+            f"PRAGMA table_info('{table_name}')"
+        ).fetchall():
+            text = f"{col_name} {col_type or 'ANY'}"
+            if pk:
+                text += " PK"
+            if col_name in foreign_keys:
+                text += f" FK→{foreign_keys[col_name]}"
+            if (col_type or "").upper().startswith(("TEXT", "VARCHAR", "CHAR")) and not pk:
+                values = [
+                    r[0]
+                    for r in conn.execute(
+                        f'SELECT DISTINCT "{col_name}" FROM "{table_name}" '
+                        f'WHERE "{col_name}" IS NOT NULL LIMIT ?',
+                        (max_distinct + 1,),
+                    )
+                ]
+                if 0 < len(values) <= max_distinct:
+                    text += " {" + "|".join(str(v) for v in values) + "}"
+            parts.append(text)
+    return f"{table_name}({', '.join(parts)})"
+
+
+def get_schema_fingerprint() -> str:
+    """返回当前表结构（sqlite_master 中的建表语句）的短哈希，可作为下游缓存键的一部分。"""
+    return _get_schema_cached("fingerprint", _compute_schema_fingerprint)
+
+
+def _compute_schema_fingerprint() -> str:
+    with readonly_connection() as conn:
+        rows = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' ORDER BY name"
+        ).fetchall()
+    return hashlib.sha1(repr(rows).encode("utf-8")).hexdigest()[:16]
+
+
+def get_table_details(exact: bool = False) -> list[dict[str, Any]]:
+    """返回结构化的表信息，用于 API 响应。
+
+    表结构与示例行随 Schema 版本缓存。行数默认取当前数据版本已缓存的精确值，
+    没有时退化为 sqlite_stat1 / max(rowid) 估算值（row_count_exact=False）；
+    exact=True 时同步统计精确行数。
+    """
+    tables = _get_schema_cached("details", _load_table_details)
+    counts = refresh_row_counts() if exact else _cached_row_counts()
+    if counts is None:
+        return tables
+    return [
+        {**t, "row_count": counts.get(t["name"], t["row_count"]), "row_count_exact": True}
+        for t in tables
+    ]
+
+
+def _load_table_details() -> list[dict[str, Any]]:
+    with readonly_connection() as conn:
         tables = []
-        cursor = conn.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
-        )
-        for row in cursor.fetchall():
-            table_name = row["name"]
+        table_names = [
+            row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+            )
+        ]
+        approximate = _approximate_row_counts(conn, table_names)
+        for table_name in table_names:
             cols_cursor = conn.execute(f"PRAGMA table_info('{table_name}')")
-            columns = [{"name": c["name"], "type": c["type"]} for c in cols_cursor.fetchall()]
-
-            count = conn.execute(f"SELECT COUNT(*) FROM '{table_name}'").fetchone()[0]
+            columns = [{"name": c[1], "type": c[2]} for c in cols_cursor.fetchall()]
 
             sample_cursor = conn.execute(f"SELECT * FROM '{table_name}' LIMIT 3")
             col_names = [desc[0] for desc in sample_cursor.description]
@@ -59,46 +341,389 @@ def get_table_details() -> list[dict[str, Any]]:
             tables.append({
                 "name": table_name,
                 "columns": columns,
-                "row_count": count,
+                "row_count": approximate[table_name],
+                "row_count_exact": False,
                 "sample_rows": sample_rows,
             })
         return tables
-    finally:
-        conn.close()
+
+
+def _approximate_row_counts(conn: sqlite3.Connection, table_names: list[str]) -> dict[str, int]:
+    """优先取 ANALYZE 写入 sqlite_stat1 的行数，缺失时用 max(rowid) 估算，均无需全表扫描。"""
+    counts: dict[str, int] = {}
+    has_stat = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='sqlite_stat1'"
+    ).fetchone()
+    if has_stat:
+        # stat 的首个数字为表（或索引）的行数；部分索引偏小，取同表各行的最大值
+        for tbl, stat in conn.execute("SELECT tbl, stat FROM sqlite_stat1"):
+            head = (stat or "").split(" ", 1)[0]
+            if tbl in table_names and head.isdigit():
+                counts[tbl] = max(counts.get(tbl, 0), int(head))
+    for table_name in table_names:
+        if table_name in counts:
+            continue
+        try:
+            counts[table_name] = conn.execute(
+                f"SELECT max(rowid) FROM '{table_name}'"
+            ).fetchone()[0] or 0
+        except sqlite3.OperationalError:  # WITHOUT ROWID 表
+            counts[table_name] = conn.execute(f"SELECT COUNT(*) FROM '{table_name}'").fetchone()[0]
+    return counts
+
+
+def _cached_row_counts() -> dict[str, int] | None:
+    if _row_counts["version"] != get_data_version():
+        return None
+    return _row_counts["counts"]
+
+
+def refresh_row_counts() -> dict[str, int]:
+    """统计各表精确行数并按当前数据版本缓存；并发调用时只有一个线程实际执行 COUNT(*)。"""
+    with _row_count_lock:
+        version = get_data_version()
+        if _row_counts["version"] == version:
+            return _row_counts["counts"]
+        with readonly_connection() as conn:
+            counts = {
+                name: conn.execute(f"SELECT COUNT(*) FROM '{name}'").fetchone()[0]
+                for (name,) in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+                ).fetchall()
+            }
+        _row_counts["counts"] = counts
+        _row_counts["version"] = version
+        return counts
 
 
 def check_sql_safety(sql: str) -> str | None:
     """检查 SQL 安全性。安全返回 None，危险返回错误描述。"""
-    stripped = sql.strip().rstrip(";").strip()
-    if DANGEROUS_KEYWORDS.search(stripped):
-        return f"SQL 包含危险操作，仅允许 SELECT 查询"
-    if not stripped.upper().startswith("SELECT"):
-        return f"仅允许 SELECT 查询语句"
-    return None
+    return sql_guard.check(sql)
+
+
+def _strip_sql(sql: str) -> str:
+    """去注释、折叠空白、去掉结尾分号，其余保持原文。"""
+    text = _SQL_CANONICAL_RE.sub(lambda m: m.group(1) or " ", sql)
+    return text.strip().rstrip(";").strip()
+
+
+def _outer_from_index(tokens: list[sql_guard.Token]) -> int:
+    """外层查询第一个 FROM 的位置，没有时返回 len(tokens)。"""
+    depth = 0
+    for i, tok in enumerate(tokens):
+        if tok == sql_guard.Token("op", "("):
+            depth += 1
+        elif tok == sql_guard.Token("op", ")"):
+            depth -= 1
+        elif depth == 0 and tok.kind == "word" and tok.value.upper() == "FROM":
+            return i
+    return len(tokens)
+
+
+def canonicalize_sql(sql: str) -> str:
+    """规范化 SQL 文本用作缓存键（去注释、折叠空白、去掉结尾分号）。
+
+    无别名的结果列名取自 SQL 原文，因此外层 FROM 之前的结果列表（含 CTE）保持原文，
+    只把开头的 SELECT / DISTINCT / ALL 大写；FROM 及其后按词法单元重新拼接、关键字统一大写。
+    无法切分时退回原文。
+    """
+    text = _strip_sql(sql)
+    try:
+        tokens = sql_guard.tokenize(text)
+    except sql_guard.SQLSyntaxError:
+        return text
+    offsets = []
+    pos = 0
+    for tok in tokens:
+        pos = text.index(tok.value, pos)
+        offsets.append(pos)
+        pos += len(tok.value)
+
+    split = _outer_from_index(tokens)
+    lead = 0
+    while (
+        lead < split
+        and tokens[lead].kind == "word"
+        and tokens[lead].value.upper() in ("SELECT", "DISTINCT", "ALL")
+    ):
+        lead += 1
+    parts = [tok.value.upper() for tok in tokens[:lead]]
+    if lead < split:
+        end = offsets[split] if split < len(tokens) else len(text)
+        parts.append(text[offsets[lead]:end].strip())
+    parts += [
+        tok.value.upper() if tok.kind == "word" and tok.value.upper() in _SQL_KEYWORDS else tok.value
+        for tok in tokens[split:]
+    ]
+    return " ".join(parts)
+
+
+def _loop_rows(detail: str, row_counts: dict[str, int], aliases: dict[str, str]) -> tuple[float, str | None]:
+    """估算单个循环步骤每次执行读取的行数，返回 (行数, 全表扫描的表名)。
+
+    SCAN 读取全表；主键 / rowid 等值查找按 1 行计；其它索引查找粗略按表行数的 1/10 计。
+    CTE、子查询等无统计信息的来源按 1 行计，其代价在子计划中单独累加。
+    """
+    m = _PLAN_LOOP_RE.match(detail)
+    if m is None:
+        return 1.0, None
+    op, name, alias, rest = m.groups()
+    key = (alias or name).lower()
+    table = aliases.get(key) or next((t for t in row_counts if t.lower() == name.lower()), None)
+    if table is None:
+        return 1.0, None
+    rows = max(row_counts[table], 1)
+    if op == "SCAN":
+        return float(rows), table
+    if "PRIMARY KEY" in rest or "(rowid=?)" in rest:
+        return 1.0, None
+    return max(rows / 10, 1.0), None
+
+
+def estimate_query_cost(sql: str) -> dict[str, Any]:
+    """基于 EXPLAIN QUERY PLAN 与表行数估算查询需读取的行数。
+
+    同一层级的 SCAN / SEARCH 构成嵌套循环，行数相乘；子查询、CTE 物化、复合查询等子计划
+    的代价相加，相关子查询再乘以外层已累计的循环次数。
+    """
+    try:
+        with readonly_connection() as conn:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    except sqlite3.Error as e:
+        raise ValueError(f"SQL 执行错误: {e}")
+
+    row_counts = {t["name"]: t["row_count"] for t in get_table_details()}
+    aliases = sql_guard.table_aliases(sql_guard.tokenize(sql), set(row_counts))
+    children: dict[int, list[tuple[int, str]]] = {}
+    for node_id, parent, _, detail in plan:
+        children.setdefault(parent, []).append((node_id, detail))
+
+    full_scans: list[str] = []
+
+    def cost_of(parent: int) -> float:
+        loops = 1.0
+        nested = 0.0
+        for node_id, detail in children.get(parent, []):
+            rows, scanned = _loop_rows(detail, row_counts, aliases)
+            loops *= rows
+            if scanned:
+                full_scans.append(scanned)
+            sub = cost_of(node_id)
+            nested += loops * sub if detail.startswith("CORRELATED") else sub
+        return loops + nested
+
+    return {
+        "rows": int(min(cost_of(0), 1e18)),
+        "full_scans": list(dict.fromkeys(full_scans)),
+        "plan": [detail for *_, detail in plan],
+    }
+
+
+def _has_outer_limit(tokens: list[sql_guard.Token]) -> bool:
+    depth = 0
+    for tok in tokens:
+        if tok.value == "(":
+            depth += 1
+        elif tok.value == ")":
+            depth -= 1
+        elif depth == 0 and tok.kind == "word" and tok.value.upper() == "LIMIT":
+            return True
+    return False
+
+
+def _inject_limit(sql: str) -> str:
+    """外层查询没有 LIMIT 时追加 LIMIT sql_max_rows，让 SQLite 取够行数即停止，而非算完再截断。"""
+    if _has_outer_limit(sql_guard.tokenize(sql)):
+        return sql
+    _execution_stats["limit_injected"] += 1
+    return f"{_strip_sql(sql)} LIMIT {settings.sql_max_rows}"
+
+
+def prepare_query(sql: str) -> tuple[str, list[str]]:
+    """执行前检查：估算扫描量（超限抛出 SQLCostError），并为外层查询补 LIMIT。
+
+    返回 (实际执行的 SQL, 提示信息列表)。
+    """
+    notes: list[str] = []
+    if settings.sql_cost_guard_enabled:
+        cost = estimate_query_cost(sql)
+        scans = "、".join(cost["full_scans"]) or "无"
+        if cost["rows"] > settings.sql_cost_max_rows:
+            _execution_stats["cost_rejected"] += 1
+            logger.warning("SQL rejected by cost guard: ~%s rows, plan=%s", cost["rows"], cost["plan"])
+            raise SQLCostError(
+                f"查询预计需扫描约 {cost['rows']:,} 行（全表扫描: {scans}），超出限制，"
+                "请添加过滤条件或聚合后重试"
+            )
+        if cost["rows"] > settings.sql_cost_warn_rows:
+            _execution_stats["cost_warnings"] += 1
+            notes.append(f"查询预计需扫描约 {cost['rows']:,} 行（全表扫描: {scans}），可能较慢")
+    return _inject_limit(sql), notes
 
 
-def execute_sql(sql: str) -> str:
-    """在 sample.db 上以只读方式执行 SQL，返回结果字符串。"""
+def execute_sql(
+    sql: str,
+    use_cache: bool = True,
+    fmt: ResultFormat = "rows",
+    warnings: list[str] | None = None,
+) -> str:
+    """在 sample.db 上以只读方式执行 SQL，返回 fmt 格式（rows / columnar）的结果字符串。
+
+    执行前的代价提示追加到 warnings（如提供）；命中结果缓存时不做代价检查。
+    """
     safety_error = check_sql_safety(sql)
     if safety_error:
         raise ValueError(safety_error)
 
-    conn = sqlite3.connect(
-        f"file:{settings.sample_db_path}?mode=ro",
-        uri=True,
-        timeout=settings.sql_timeout,
-    )
-    try:
-        cursor = conn.execute(sql)
-        columns = [desc[0] for desc in cursor.description] if cursor.description else []
-        rows = cursor.fetchmany(settings.sql_max_rows)
+    cache_key = data_version = None
+    if use_cache and settings.result_cache_enabled:
+        cache_key = result_cache.make_key(canonicalize_sql(sql), settings.sql_max_rows, fmt)
+        data_version = get_data_version()
+        cached = result_cache.lookup(cache_key, data_version)
+        if cached is not None:
+            return cached
 
-        result_dicts = [dict(zip(columns, row)) for row in rows]
-        return json.dumps(result_dicts, ensure_ascii=False, default=str)
-    except Exception as e:
-        raise ValueError(f"SQL 执行错误: {e}")
-    finally:
-        conn.close()
+    prepared, notes = prepare_query(sql)
+    if warnings is not None:
+        warnings.extend(notes)
+    started = time.perf_counter()
+    result = _run_query(prepared, fmt)
+    index_advisor.record(prepared, (time.perf_counter() - started) * 1000)
+    if cache_key is not None:
+        result_cache.store(cache_key, data_version, result)
+    return result
+
+
+def get_execution_stats() -> dict[str, int]:
+    return dict(_execution_stats)
+
+
+def _install_budget(conn: sqlite3.Connection) -> dict[str, Any]:
+    """注册 progress handler：超过 sql_timeout 秒或 sql_max_vm_steps 条 VM 指令即中断查询。"""
+    interval = settings.sql_progress_interval
+    state: dict[str, Any] = {
+        "deadline": time.monotonic() + settings.sql_timeout,
+        "steps": 0,
+        "reason": None,
+    }
+
+    def handler() -> int:
+        state["steps"] += interval
+        if state["steps"] > settings.sql_max_vm_steps:
+            state["reason"] = "step_budget_exceeded"
+            return 1
+        if time.monotonic() > state["deadline"]:
+            state["reason"] = "timeouts"
+            return 1
+        return 0
+
+    conn.set_progress_handler(handler, interval)
+    return state
+
+
+def _budget_error(reason: str) -> SQLTimeoutError:
+    _execution_stats[reason] += 1
+    logger.warning("SQL execution interrupted: %s", reason)
+    if reason == "timeouts":
+        return SQLTimeoutError(f"SQL 执行超时（超过 {settings.sql_timeout} 秒），请缩小查询范围后重试")
+    return SQLTimeoutError("SQL 计算量超出限制，请添加过滤条件或聚合后重试")
+
+
+def _run_query(sql: str, fmt: ResultFormat) -> str:
+    with readonly_connection() as conn:
+        budget = _install_budget(conn)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql)
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+            rows = cursor.fetchmany(settings.sql_max_rows)
+        except Exception as e:
+            if budget["reason"]:
+                raise _budget_error(budget["reason"])
+            raise ValueError(f"SQL 执行错误: {e}")
+        finally:
+            cursor.close()
+            conn.set_progress_handler(None, 0)
+
+    return result_format.encode(columns, rows, fmt)
+
+
+def stream_sql(
+    sql: str,
+    batch_size: int | None = None,
+    use_cache: bool = True,
+    fmt: ResultFormat = "rows",
+) -> Iterator[tuple[str, Any]]:
+    """以游标分批读取查询结果。
+
+    依次产出可选的 ("warning", 代价提示)、("header", {"columns", "types"})、若干 ("rows", [[...], ...])，
+    最后产出 ("result", 完整结果字符串)，其格式与同参数的 execute_sql 返回值一致。
+    执行超时只统计游标取数耗时，不包括调用方发送事件的时间。
+    """
+    safety_error = check_sql_safety(sql)
+    if safety_error:
+        raise ValueError(safety_error)
+    batch_size = batch_size or settings.sql_stream_batch_size
+
+    cache_key = data_version = None
+    if use_cache and settings.result_cache_enabled:
+        cache_key = result_cache.make_key(canonicalize_sql(sql), settings.sql_max_rows, fmt)
+        data_version = get_data_version()
+        cached = result_cache.lookup(cache_key, data_version)
+        if cached is not None:
+            columns, rows = result_format.decode(cached)
+            yield "header", {"columns": columns, "types": infer_column_types(columns, rows)}
+            for start in range(0, len(rows), batch_size):
+                yield "rows", rows[start:start + batch_size]
+            yield "result", cached
+            return
+
+    prepared, notes = prepare_query(sql)
+    for note in notes:
+        yield "warning", note
+
+    rows: list[tuple] = []
+    with readonly_connection() as conn:
+        budget = _install_budget(conn)
+        remaining = float(settings.sql_timeout)
+        cursor = conn.cursor()
+
+        def timed(fn: Callable[[], T]) -> T:
+            nonlocal remaining
+            started = time.monotonic()
+            budget["deadline"] = started + remaining
+            try:
+                return fn()
+            except Exception as e:
+                if budget["reason"]:
+                    raise _budget_error(budget["reason"])
+                raise ValueError(f"SQL 执行错误: {e}")
+            finally:
+                remaining -= time.monotonic() - started
+
+        try:
+            timed(lambda: cursor.execute(prepared))
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+            first = True
+            while len(rows) < settings.sql_max_rows:
+                size = min(batch_size, settings.sql_max_rows - len(rows))
+                batch = timed(lambda: cursor.fetchmany(size))
+                if first:
+                    yield "header", {"columns": columns, "types": infer_column_types(columns, batch)}
+                    first = False
+                if not batch:
+                    break
+                rows.extend(batch)
+                yield "rows", [list(r) for r in batch]
+        finally:
+            cursor.close()
+            conn.set_progress_handler(None, 0)
+
+    index_advisor.record(prepared, (settings.sql_timeout - remaining) * 1000)
+    result = result_format.encode(columns, rows, fmt)
+    if cache_key is not None:
+        result_cache.store(cache_key, data_version, result)
+    yield "result", result
 
 
 def clean_generated_sql(raw: str) -> str:
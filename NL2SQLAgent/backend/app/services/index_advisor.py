@@ -0,0 +1,397 @@
+"""索引建议：按指纹记录实际执行的 SQL 及其执行计划，据此推荐（覆盖）索引，并可在库的临时副本上验证收益。
+
+工作负载保存在本地 SQLite 文件中，多个 uvicorn worker 与命令行共享：
+
+    python -m app.services.index_advisor [--evaluate] [--top N]
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from app.config import settings
+from app.services import db_service, sql_guard
+from app.services.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_store_ready = False
+
+# 本进程已记录过执行计划的指纹，避免每次执行都 EXPLAIN；按 LRU 限制条数，淘汰后至多重新抓取一次
+_planned: LRUCache[bool] = LRUCache(max_entries=settings.index_advisor_planned_size)
+
+_EQ_OPS = {"=", "==", "IN", "IS"}
+_RANGE_OPS = {"<", ">", "<=", ">=", "BETWEEN", "LIKE", "GLOB"}
+_CLAUSES = {"SELECT", "WHERE", "ON", "GROUP", "ORDER", "HAVING", "LIMIT", "FROM", "JOIN"}
+# 在同一层括号内结束 FROM 子句的关键字
+_FROM_END = {"WHERE", "GROUP", "ORDER", "HAVING", "LIMIT", "WINDOW", "UNION", "EXCEPT", "INTERSECT"}
+
+
+def _get_store() -> sqlite3.Connection:
+    global _store_ready
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+    conn = sqlite3.connect(settings.index_advisor_path, timeout=1.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if not _store_ready:
+        with _init_lock:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS workload ("
+                "key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, sql TEXT NOT NULL, "
+                "plan TEXT, executions INTEGER NOT NULL, total_ms REAL NOT NULL, "
+                "last_seen REAL NOT NULL)"
+            )
+            conn.commit()
+            _store_ready = True
+    _local.conn = conn
+    return conn
+
+
+def _explain(conn: sqlite3.Connection, sql: str) -> list[str]:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def record(sql: str, elapsed_ms: float) -> None:
+    """记录一次成功执行的查询。同一指纹只在本进程首次出现时抓取执行计划。
+
+    在查询执行路径上调用，任何失败（连接池繁忙、工作负载库被锁等）只记日志，不向外抛出。
+    """
+    if not settings.index_advisor_enabled:
+        return
+    try:
+        fingerprint = sql_guard.fingerprint(sql)
+        key = hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()
+        plan = None
+        if _planned.get(key) is None:
+            with db_service.readonly_connection() as conn:
+                plan = json.dumps(_explain(conn, sql), ensure_ascii=False)
+            _planned.set(key, True)
+        store = _get_store()
+        store.execute(
+            "INSERT INTO workload (key, fingerprint, sql, plan, executions, total_ms, last_seen) "
+            "VALUES (?, ?, ?, ?, 1, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET sql = excluded.sql, "
+            "plan = COALESCE(excluded.plan, plan), executions = executions + 1, "
+            "total_ms = total_ms + excluded.total_ms, last_seen = excluded.last_seen",
+            (key, fingerprint, sql, plan, elapsed_ms, time.time()),
+        )
+        store.commit()
+    except Exception as e:
+        logger.warning(f"Failed to record workload: {e}")
+
+
+def load_workload() -> list[dict[str, Any]]:
+    rows = _get_store().execute(
+        "SELECT fingerprint, sql, plan, executions, total_ms FROM workload "
+        "ORDER BY executions DESC"
+    ).fetchall()
+    return [
+        {
+            "fingerprint": fp,
+            "sql": sql,
+            "plan": json.loads(plan) if plan else [],
+            "executions": executions,
+            "total_ms": total_ms,
+        }
+        for fp, sql, plan, executions, total_ms in rows
+    ]
+
+
+def _load_catalog() -> dict[str, dict[str, Any]]:
+    """每张表的列、rowid 别名列（INTEGER PRIMARY KEY）与已有索引的列序列。"""
+    catalog: dict[str, dict[str, Any]] = {}
+    with db_service.readonly_connection() as conn:
+        tables = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()
+        for (table,) in tables:
+            info = conn.execute(f"PRAGMA table_info('{table}')").fetchall()
+            pks = [c for c in info if c[5]]
+            rowid = pks[0][1] if len(pks) == 1 and (pks[0][2] or "").upper() == "INTEGER" else None
+            indexes = []
+            for idx in conn.execute(f"PRAGMA index_list('{table}')").fetchall():
+                cols = [c[2] for c in conn.execute(f"PRAGMA index_info('{idx[1]}')")]
+                indexes.append([c for c in cols if c is not None])
+            catalog[table] = {"columns": [c[1] for c in info], "rowid": rowid, "indexes": indexes}
+    return catalog
+
+
+def _star_tables(
+    tokens: list[sql_guard.Token], start: int, catalog: dict[str, dict[str, Any]]
+) -> list[str]:
+    """SELECT * 所在查询自身 FROM 子句中的表（同一层括号内），不含子查询里的表。"""
+    lookup = {t.lower(): t for t in catalog}
+    tables: list[str] = []
+    depth = 0
+    in_from = False
+    for i in range(start + 1, len(tokens)):
+        tok = tokens[i]
+        if tok == sql_guard.Token("op", "("):
+            depth += 1
+            continue
+        if tok == sql_guard.Token("op", ")"):
+            depth -= 1
+            if depth < 0:
+                break
+            continue
+        if depth > 0:
+            continue
+        upper = tok.value.upper() if tok.kind == "word" else ""
+        if upper == "FROM":
+            in_from = True
+        elif upper in _FROM_END:
+            if in_from:
+                break
+        elif in_from and tokens[i - 1].value.upper() in ("FROM", "JOIN", ","):
+            name = sql_guard.identifier(tok)
+            if name and name.lower() in lookup and lookup[name.lower()] not in tables:
+                tables.append(lookup[name.lower()])
+    return tables
+
+
+def _column_usage(sql: str, catalog: dict[str, dict[str, Any]]) -> dict[str, dict[str, list[str]]]:
+    """按子句归类查询中引用的列：表 -> {eq, range, group, order, other: [列名]}。
+
+    带限定名的列通过 FROM / JOIN 别名解析；未限定的列归属到查询中唯一包含该列的表。
+    """
+    tokens = sql_guard.tokenize(sql)
+    aliases = sql_guard.table_aliases(tokens, set(catalog))
+    in_query = set(aliases.values())
+    for i in range(1, len(tokens)):
+        name = sql_guard.identifier(tokens[i])
+        if name and tokens[i - 1].value.upper() in ("FROM", "JOIN", ","):
+            for table in catalog:
+                if table.lower() == name.lower():
+                    in_query.add(table)
+                    aliases.setdefault(table.lower(), table)
+
+    def resolve(qualifier: str | None, column: str) -> tuple[str, str] | None:
+        candidates = [aliases[qualifier.lower()]] if qualifier and qualifier.lower() in aliases else (
+            [] if qualifier else sorted(in_query)
+        )
+        matches = [
+            (t, c) for t in candidates for c in catalog[t]["columns"] if c.lower() == column.lower()
+        ]
+        return matches[0] if len(matches) == 1 else None
+
+    usage: dict[str, dict[str, list[str]]] = {}
+    clause = "SELECT"
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        upper = tok.value.upper() if tok.kind == "word" else tok.value
+        if tok.kind == "word" and upper in _CLAUSES:
+            clause = upper
+            i += 1
+            continue
+        if tok.value == "*" and clause == "SELECT" and i > 0:
+            # SELECT * / t.*：该表全部列都被读取
+            prev = tokens[i - 1]
+            star_tables = (
+                [aliases[tokens[i - 2].value.lower()]]
+                if prev.value == "." and i > 1 and tokens[i - 2].value.lower() in aliases
+                else _star_tables(tokens, i, catalog)
+                if prev.value.upper() in ("SELECT", "DISTINCT", ",")
+                else []
+            )
+            for table in star_tables:
+                roles = usage.setdefault(
+                    table, {"eq": [], "range": [], "group": [], "order": [], "other": []}
+                )
+                roles["other"] += [c for c in catalog[table]["columns"] if c not in roles["other"]]
+            i += 1
+            continue
+        name = sql_guard.identifier(tok)
+        if name is None or (i + 1 < len(tokens) and tokens[i + 1].value == "("):
+            i += 1
+            continue
+        qualifier = None
+        end = i
+        if i + 2 < len(tokens) and tokens[i + 1].value == "." and sql_guard.identifier(tokens[i + 2]):
+            qualifier, name, end = name, sql_guard.identifier(tokens[i + 2]), i + 2
+        resolved = resolve(qualifier, name)
+        if resolved:
+            table, column = resolved
+            prev = tokens[i - 1].value.upper() if i > 0 else ""
+            nxt = tokens[end + 1].value.upper() if end + 1 < len(tokens) else ""
+            if clause in ("WHERE", "ON"):
+                if nxt in _EQ_OPS or prev in ("=", "=="):
+                    role = "eq"
+                elif nxt in _RANGE_OPS or prev in _RANGE_OPS or nxt == "NOT":
+                    role = "range"
+                else:
+                    role = "other"
+            elif clause in ("GROUP", "ORDER"):
+                role = clause.lower()
+            else:
+                role = "other"
+            roles = usage.setdefault(
+                table, {"eq": [], "range": [], "group": [], "order": [], "other": []}
+            )
+            if column not in roles[role]:
+                roles[role].append(column)
+        i = end + 1
+    return usage
+
+
+def _candidate(
+    table: str,
+    roles: dict[str, list[str]],
+    catalog: dict[str, dict[str, Any]],
+) -> dict[str, Any] | None:
+    """等值过滤列在前，其后一个范围列（或分组 / 排序列）；其余引用列放得下时追加为覆盖索引。
+
+    需要读取整行（如 SELECT *）时覆盖索引只是表的副本，只推荐键列。
+    """
+    rowid = catalog[table]["rowid"]
+    key = [c for c in roles["eq"] if c != rowid]
+    tail = roles["range"][:1] or roles["group"] or roles["order"]
+    key += [c for c in tail if c not in key and c != rowid]
+    if not key:
+        return None
+    referenced = roles["range"] + roles["group"] + roles["order"] + roles["other"]
+    extra = [c for c in dict.fromkeys(referenced) if c not in key and c != rowid]
+    whole_row = set(catalog[table]["columns"]) <= set(key + extra) | {rowid}
+    covering = not whole_row and len(key) + len(extra) <= settings.index_advisor_max_columns
+    columns = key + extra if covering else key
+    if any(existing[:len(columns)] == columns for existing in catalog[table]["indexes"]):
+        return None
+    return {"table": table, "columns": columns, "covering": covering}
+
+
+def _index_name(table: str, columns: list[str]) -> str:
+    return "ix_" + "_".join([table, *columns])
+
+
+def _ddl(table: str, columns: list[str]) -> str:
+    cols = ", ".join(f'"{c}"' for c in columns)
+    return f'CREATE INDEX "{_index_name(table, columns)}" ON "{table}" ({cols})'
+
+
+def recommend(top: int | None = None) -> list[dict[str, Any]]:
+    """根据已记录的工作负载给出索引建议，按受益查询的执行次数排序。"""
+    catalog = _load_catalog()
+    merged: dict[tuple[str, tuple[str, ...]], dict[str, Any]] = {}
+    for query in load_workload():
+        try:
+            tokens = sql_guard.tokenize(query["sql"])
+            usage = _column_usage(query["sql"], catalog)
+        except sql_guard.SQLSyntaxError:
+            continue
+        # 执行计划中带别名的表以别名显示，先映射回表名
+        aliases = sql_guard.table_aliases(tokens, set(catalog))
+        scanned = set()
+        for step in query["plan"]:
+            if step.startswith("SCAN "):
+                name = step.split()[1].lower()
+                scanned.add(aliases.get(name) or next((t for t in catalog if t.lower() == name), name))
+        for table, roles in usage.items():
+            candidate = _candidate(table, roles, catalog)
+            if candidate is None:
+                continue
+            entry = merged.setdefault(
+                (table, tuple(candidate["columns"])),
+                {
+                    **candidate,
+                    "index_name": _index_name(table, candidate["columns"]),
+                    "ddl": _ddl(table, candidate["columns"]),
+                    "executions": 0,
+                    "full_scan": False,
+                    "queries": [],
+                },
+            )
+            entry["executions"] += query["executions"]
+            entry["queries"].append(query["sql"])
+            entry["full_scan"] |= table in scanned
+
+    ranked = sorted(merged.values(), key=lambda e: (e["full_scan"], e["executions"]), reverse=True)
+    return ranked[: top or settings.index_advisor_top_k]
+
+
+def _time_queries(conn: sqlite3.Connection, sqls: list[str]) -> float | None:
+    """各查询取 index_advisor_repeat 次中的最短耗时后求和（毫秒）；超时返回 None。"""
+    total = 0.0
+    for sql in sqls:
+        best = None
+        for _ in range(settings.index_advisor_repeat):
+            deadline = time.monotonic() + settings.sql_timeout
+            conn.set_progress_handler(
+                lambda: int(time.monotonic() > deadline), settings.sql_progress_interval
+            )
+            started = time.perf_counter()
+            try:
+                conn.execute(sql).fetchall()
+            except sqlite3.OperationalError:
+                return None
+            finally:
+                conn.set_progress_handler(None, 0)
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        total += best or 0.0
+    return total
+
+
+def evaluate(recommendations: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """在业务库的临时副本上逐个建索引并重放相关查询，记录耗时、加速比与新执行计划。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = sqlite3.connect(str(Path(tmp) / "scratch.db"))
+        try:
+            source = sqlite3.connect(f"file:{settings.sample_db_path}?mode=ro", uri=True)
+            try:
+                source.backup(scratch)
+            finally:
+                source.close()
+            scratch.execute("ANALYZE")
+            for rec in recommendations:
+                baseline = _time_queries(scratch, rec["queries"])
+                scratch.execute(rec["ddl"])
+                scratch.execute("ANALYZE")
+                indexed = _time_queries(scratch, rec["queries"])
+                rec["plan_after"] = _explain(scratch, rec["queries"][0])
+                scratch.execute(f'DROP INDEX "{rec["index_name"]}"')
+                rec["baseline_ms"] = round(baseline, 3) if baseline is not None else None
+                rec["indexed_ms"] = round(indexed, 3) if indexed is not None else None
+                rec["speedup"] = (
+                    round(baseline / indexed, 2) if baseline and indexed else None
+                )
+        finally:
+            scratch.close()
+    return recommendations
+
+
+def advise(top: int | None = None, run_evaluation: bool = False) -> dict[str, Any]:
+    recommendations = recommend(top)
+    if run_evaluation and recommendations:
+        recommendations = evaluate(recommendations)
+    workload = load_workload()
+    return {
+        "workload": {
+            "fingerprints": len(workload),
+            "executions": sum(q["executions"] for q in workload),
+        },
+        "recommendations": recommendations,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="根据已执行的 SQL 推荐业务库索引")
+    parser.add_argument("--evaluate", action="store_true", help="在临时副本上建索引并测量加速比")
+    parser.add_argument("--top", type=int, default=None, help="最多输出的建议条数")
+    args = parser.parse_args()
+    print(json.dumps(advise(args.top, args.evaluate), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
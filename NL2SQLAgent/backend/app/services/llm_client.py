@@ -0,0 +1,72 @@
+"""LLM 客户端注册表：按 (model, temperature, streaming) 复用 ChatTongyi 实例与 HTTP 连接池。"""
+from __future__ import annotations
+
+import os
+import threading
+
+import requests
+from langchain_community.chat_models.tongyi import ChatTongyi
+from requests.adapters import HTTPAdapter
+
+from app.config import settings
+
+os.environ["DASHSCOPE_API_KEY"] = settings.dashscope_api_key
+
+ClientKey = tuple[str, float, bool]
+
+_clients: dict[ClientKey, ChatTongyi] = {}
+_http_session: requests.Session | None = None
+_lock = threading.Lock()
+
+
+def _create_http_session() -> requests.Session:
+    """创建带 keep-alive 连接池的 requests.Session，供 DashScope SDK 复用 TCP/TLS 连接。"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=settings.llm_pool_connections,
+        pool_maxsize=settings.llm_pool_size,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _get_http_session() -> requests.Session:
+    global _http_session
+    if _http_session is None:
+        _http_session = _create_http_session()
+    return _http_session
+
+
+def get_llm(streaming: bool = False, temperature: float = 0, model: str | None = None) -> ChatTongyi:
+    """返回共享的 ChatTongyi 实例，同一 (model, temperature, streaming) 只构造一次。"""
+    key: ClientKey = (model or settings.llm_model_name, float(temperature), streaming)
+    llm = _clients.get(key)
+    if llm is not None:
+        return llm
+    with _lock:
+        llm = _clients.get(key)
+        if llm is None:
+            llm = ChatTongyi(
+                model=key[0],
+                streaming=streaming,
+                model_kwargs={"temperature": key[1], "session": _get_http_session()},
+            )
+            _clients[key] = llm
+    return llm
+
+
+def init_llm_clients() -> None:
+    """应用启动时预热常用客户端，避免首个请求承担构造开销。"""
+    get_llm(streaming=False)
+    get_llm(streaming=True)
+
+
+def close_llm_clients() -> None:
+    """应用关闭时释放客户端与连接池。"""
+    global _http_session
+    with _lock:
+        _clients.clear()
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
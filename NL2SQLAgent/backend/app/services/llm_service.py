@@ -1,33 +1,59 @@
 """LLM 核心服务：NL→SQL、结果解读、上下文记忆管理。"""
 from __future__ import annotations
 
-import os
-from collections import defaultdict
+import asyncio
+import hashlib
+import re
+import unicodedata
+from datetime import datetime
 from typing import AsyncGenerator
 
-from langchain_community.chat_models.tongyi import ChatTongyi
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_core.prompts import PromptTemplate
 
 from app.config import settings
 from app.prompts.text_to_sql import ANSWER_TEMPLATE, TEXT_TO_SQL_TEMPLATE
-from app.services.db_service import clean_generated_sql, get_schema_text
+from app.services import schema_index
+from app.services.cache import LRUCache
+from app.services.db_service import (
+    clean_generated_sql,
+    get_schema_fingerprint,
+    get_schema_text,
+)
+from app.services.llm_client import get_llm
+from app.services.result_digest import prepare_for_prompt
+
+
+def _memory_size(memory: dict) -> int:
+    return sum(
+        len(h["question"].encode("utf-8"))
+        + len(h["sql"].encode("utf-8"))
+        + len(h["answer"].encode("utf-8"))
+        for h in memory["history"]
+    )
 
-os.environ["DASHSCOPE_API_KEY"] = settings.dashscope_api_key
 
-_conversation_memory: dict[str, list[dict]] = defaultdict(list)
+# 会话上下文记忆：按会话数与总字节数 LRU 淘汰，未命中时再从数据库加载。
+# 每条记忆带上加载时会话的 updated_at 作为版本，多 worker 部署下其他进程写入后版本不一致即重新加载
+_conversation_memory: LRUCache[dict] = LRUCache(
+    max_entries=settings.memory_max_sessions,
+    max_bytes=settings.memory_max_bytes,
+    sizeof=_memory_size,
+)
+_memory_stale_reloads = 0
 
+# NL→SQL 生成缓存：(规范化问题, Schema 指纹, 历史上下文哈希) -> SQL
+_sql_cache: LRUCache[str] = LRUCache(
+    max_entries=settings.sql_cache_size,
+    ttl=settings.sql_cache_ttl,
+)
 
-def _get_llm(streaming: bool = False) -> ChatTongyi:
-    return ChatTongyi(
-        model=settings.llm_model_name,
-        temperature=0,
-        streaming=streaming,
-    )
+_TRAILING_PUNCT = re.compile(r"[\s?？!！。.,，;；~～]+$")
 
 
 def _format_history(session_id: str) -> str:
-    history = _conversation_memory.get(session_id, [])
+    memory = _conversation_memory.peek(session_id)
+    history = memory["history"] if memory else []
     if not history:
         return "（无历史对话）"
     lines = []
@@ -39,19 +65,47 @@ def _format_history(session_id: str) -> str:
     return "\n".join(lines)
 
 
-def add_to_memory(session_id: str, question: str, sql: str, answer: str) -> None:
-    _conversation_memory[session_id].append({
-        "question": question,
-        "sql": sql,
-        "answer": answer,
+def has_memory(session_id: str, version: datetime | None) -> bool:
+    """会话记忆是否已在内存中且与数据库中的会话版本一致；否则调用方需从数据库重新加载。"""
+    global _memory_stale_reloads
+    memory = _conversation_memory.get(session_id)
+    if memory is None:
+        return False
+    if memory["version"] != version:
+        _memory_stale_reloads += 1
+        return False
+    return True
+
+
+def add_to_memory(
+    session_id: str, question: str, sql: str, answer: str, version: datetime | None
+) -> None:
+    """增量追加一轮对话并记下本轮写入后的会话版本。会话已被淘汰时不做处理，下次访问会从数据库完整加载。"""
+    memory = _conversation_memory.peek(session_id)
+    if memory is None:
+        return
+    entry = {"question": question, "sql": sql, "answer": answer}
+    _conversation_memory.set(session_id, {
+        "version": version,
+        "history": (memory["history"] + [entry])[-settings.memory_window:],
     })
-    if len(_conversation_memory[session_id]) > settings.memory_window * 2:
-        _conversation_memory[session_id] = _conversation_memory[session_id][-settings.memory_window:]
 
 
-def load_memory_from_messages(session_id: str, messages: list) -> None:
-    """从数据库消息记录恢复上下文记忆。"""
-    _conversation_memory[session_id] = []
+def forget_memory(session_id: str) -> None:
+    _conversation_memory.pop(session_id)
+
+
+def get_memory_stats() -> dict:
+    return {**_conversation_memory.stats(), "stale_reloads": _memory_stale_reloads}
+
+
+def load_memory_from_messages(
+    session_id: str, messages: list, version: datetime | None
+) -> None:
+    """从数据库消息记录恢复上下文记忆。
+
+    最后一条助手消息尚未写入内容（其他 worker 的回答仍在生成或落库中）时不记录版本，下次访问再次加载。
+    """
     pairs = []
     current_q = None
     for msg in messages:
@@ -64,14 +118,58 @@ def load_memory_from_messages(session_id: str, messages: list) -> None:
                 "answer": msg.content or "",
             })
             current_q = None
-    _conversation_memory[session_id] = pairs[-settings.memory_window:]
+    if messages and messages[-1].role == "assistant" and not messages[-1].content:
+        version = None
+    _conversation_memory.set(session_id, {
+        "version": version,
+        "history": pairs[-settings.memory_window:],
+    })
+
+
+def _normalize_question(question: str) -> str:
+    """统一全半角、大小写与空白，并去掉句末标点，使同义的重复提问命中同一缓存键。"""
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = " ".join(text.split())
+    return _TRAILING_PUNCT.sub("", text)
 
 
-def generate_sql(question: str, session_id: str) -> str:
-    """根据自然语言问题生成 SQL。"""
-    llm = _get_llm()
-    schema = get_schema_text()
+def _generation_cache_key(question: str, fingerprint: str, history: str) -> tuple[str, str, str]:
+    history_hash = hashlib.sha1(history.encode("utf-8")).hexdigest()[:16]
+    return _normalize_question(question), fingerprint, history_hash
+
+
+def _load_schema(question: str) -> tuple[str, str]:
+    """返回 (prompt 用 Schema 文本, Schema 指纹)。表数量较多时只注入检索出的相关表。"""
+    tables = None
+    if schema_index.table_count() >= settings.schema_retrieval_min_tables:
+        tables = schema_index.select_tables(question)
+    return get_schema_text(tables, settings.schema_prompt_format), get_schema_fingerprint()
+
+
+def get_generation_cache_stats() -> dict:
+    return _sql_cache.stats()
+
+
+async def discard_cached_sql(question: str, session_id: str) -> None:
+    """生成的 SQL 未通过检查或执行失败时调用，避免缓存反复返回坏结果。"""
+    fingerprint = await asyncio.to_thread(get_schema_fingerprint)
     history = _format_history(session_id)
+    _sql_cache.pop(_generation_cache_key(question, fingerprint, history))
+
+
+async def generate_sql(question: str, session_id: str, use_cache: bool = True) -> str:
+    """根据自然语言问题生成 SQL。use_cache=False 时跳过生成缓存直接调用 LLM。"""
+    schema, fingerprint = await asyncio.to_thread(_load_schema, question)
+    history = _format_history(session_id)
+
+    cache_key = None
+    if use_cache and settings.sql_cache_enabled:
+        cache_key = _generation_cache_key(question, fingerprint, history)
+        cached_sql = _sql_cache.get(cache_key)
+        if cached_sql is not None:
+            return cached_sql
+
+    llm = get_llm()
 
     prompt = PromptTemplate.from_template(TEXT_TO_SQL_TEMPLATE)
     prompt_value = prompt.invoke({
@@ -80,9 +178,12 @@ def generate_sql(question: str, session_id: str) -> str:
         "question": question,
     })
 
-    response: AIMessage = llm.invoke(prompt_value.to_messages())
+    response: AIMessage = await llm.ainvoke(prompt_value.to_messages())
     raw_sql = response.content.strip()
-    return clean_generated_sql(raw_sql)
+    sql = clean_generated_sql(raw_sql)
+    if cache_key is not None:
+        _sql_cache.set(cache_key, sql)
+    return sql
 
 
 async def stream_answer(
@@ -91,15 +192,15 @@ async def stream_answer(
     query_result: str,
 ) -> AsyncGenerator[str, None]:
     """流式生成自然语言回答，yield 每个文本 chunk。"""
-    llm = _get_llm(streaming=True)
+    llm = get_llm(streaming=True)
     prompt = PromptTemplate.from_template(ANSWER_TEMPLATE)
     prompt_value = prompt.invoke({
         "question": question,
         "sql": sql,
-        "result": query_result,
+        "result": prepare_for_prompt(query_result),
     })
 
-    for chunk in llm.stream(prompt_value.to_messages()):
+    async for chunk in llm.astream(prompt_value.to_messages()):
         if chunk.content:
             text = chunk.content
             if text.startswith(" ") and not text.startswith("  "):
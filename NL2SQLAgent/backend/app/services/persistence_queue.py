@@ -0,0 +1,157 @@
+"""助手消息写回队列：请求路径只负责入队，后台任务把多条 update_message 合并为一个事务写入 app.db。
+
+队列有上限，写满时 enqueue 会等待（背压），并记录等待次数与耗时；关闭时先排空队列再退出。
+整批写入失败（如 database is locked）时按间隔重试，仍失败则逐条写入，只丢弃自身写不进去的消息。
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any
+
+from app.config import settings
+from app.models.database import async_session
+from app.services import session_service
+
+logger = logging.getLogger(__name__)
+
+_queue: asyncio.Queue[tuple[str, dict[str, Any]]] | None = None
+_writer: asyncio.Task | None = None
+
+_stats = {
+    "enqueued": 0,
+    "written": 0,
+    "batches": 0,
+    "retries": 0,
+    "errors": 0,
+    "backpressure_waits": 0,
+    "backpressure_wait_ms": 0.0,
+    "max_depth": 0,
+}
+
+
+def _merge(batch: list[tuple[str, dict[str, Any]]]) -> list[tuple[str, dict[str, Any]]]:
+    """同一条消息的多次更新合并为一次，后写入的字段覆盖先写入的。"""
+    merged: dict[str, dict[str, Any]] = {}
+    for message_id, fields in batch:
+        merged.setdefault(message_id, {}).update(
+            {k: v for k, v in fields.items() if v is not None}
+        )
+    return list(merged.items())
+
+
+async def _write_batch(batch: list[tuple[str, dict[str, Any]]]) -> None:
+    updates = _merge(batch)
+    for attempt in range(settings.persist_retries + 1):
+        if attempt:
+            _stats["retries"] += 1
+            await asyncio.sleep(settings.persist_retry_delay)
+        try:
+            async with async_session() as db:
+                await session_service.update_messages(db, updates)
+            _stats["written"] += len(batch)
+            _stats["batches"] += 1
+            return
+        except Exception as e:
+            logger.warning(
+                f"Failed to persist {len(updates)} message update(s) (attempt {attempt + 1}): {e}"
+            )
+
+    # 整批仍失败：逐条写入，避免一条坏数据或持续锁竞争拖累整批
+    counts = Counter(message_id for message_id, _ in batch)
+    for message_id, fields in updates:
+        try:
+            async with async_session() as db:
+                await session_service.update_message(db, message_id, **fields)
+            _stats["written"] += counts[message_id]
+        except Exception as e:
+            _stats["errors"] += 1
+            logger.error(f"Failed to persist update for message {message_id}: {e}")
+
+
+async def _run(queue: asyncio.Queue[tuple[str, dict[str, Any]]]) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + settings.persist_batch_wait
+        while len(batch) < settings.persist_batch_size:
+            if queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(queue.get_nowait())
+        try:
+            await _write_batch(batch)
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+
+def start() -> None:
+    global _queue, _writer
+    _queue = asyncio.Queue(maxsize=settings.persist_queue_size)
+    _writer = asyncio.create_task(_run(_queue), name="message-writer")
+
+
+async def stop(timeout: float = 10.0) -> None:
+    """等待队列中已有的更新全部落库后停止后台任务。"""
+    global _queue, _writer
+    if _queue is None or _writer is None:
+        return
+    try:
+        await asyncio.wait_for(_queue.join(), timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"Message writer did not drain in {timeout}s, {_queue.qsize()} update(s) lost")
+    _writer.cancel()
+    try:
+        await _writer
+    except asyncio.CancelledError:
+        pass
+    _queue = _writer = None
+
+
+async def enqueue(
+    message_id: str,
+    content: str | None = None,
+    sql_query: str | None = None,
+    query_result: str | None = None,
+    chart_config: dict | None = None,
+) -> None:
+    """提交一次消息更新；写回任务未启动时（如脚本直接调用）同步落库。"""
+    fields = {
+        "content": content,
+        "sql_query": sql_query,
+        "query_result": query_result,
+        "chart_config": chart_config,
+    }
+    if _queue is None:
+        async with async_session() as db:
+            await session_service.update_message(db, message_id, **fields)
+        return
+
+    item = (message_id, fields)
+    try:
+        _queue.put_nowait(item)
+    except asyncio.QueueFull:
+        _stats["backpressure_waits"] += 1
+        started = time.perf_counter()
+        await _queue.put(item)
+        _stats["backpressure_wait_ms"] += (time.perf_counter() - started) * 1000
+    _stats["enqueued"] += 1
+    _stats["max_depth"] = max(_stats["max_depth"], _queue.qsize())
+
+
+def stats() -> dict[str, Any]:
+    return {
+        **_stats,
+        "backpressure_wait_ms": round(_stats["backpressure_wait_ms"], 1),
+        "depth": _queue.qsize() if _queue is not None else 0,
+        "max_size": settings.persist_queue_size,
+    }
@@ -0,0 +1,112 @@
+"""SQL 查询结果缓存：内存 LRU 层（按字节限额）+ 本地 SQLite 磁盘层（多个 uvicorn worker 共享）。
+
+缓存条目携带业务库的数据版本，版本不一致即视为失效，无需主动清理。
+"""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from app.config import settings
+from app.services.cache import LRUCache
+
+# 键为 (结果键, 数据版本)，旧版本条目不再被访问，随 LRU 自然淘汰
+_memory: LRUCache[str] = LRUCache(
+    max_entries=settings.result_cache_max_entries,
+    max_bytes=settings.result_cache_memory_bytes,
+    sizeof=lambda result: len(result.encode("utf-8")),
+)
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_disk_ready = False
+
+_disk_stats = {"hits": 0, "misses": 0, "writes": 0, "errors": 0}
+
+
+def make_key(canonical_sql: str, *parts: Any) -> str:
+    raw = "\x1f".join([canonical_sql, *(str(p) for p in parts)])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _get_disk_conn() -> sqlite3.Connection:
+    global _disk_ready
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+    conn = sqlite3.connect(settings.result_cache_path, timeout=1.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if not _disk_ready:
+        with _init_lock:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS result_cache ("
+                "key TEXT PRIMARY KEY, data_version TEXT NOT NULL, "
+                "result TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_result_cache_created ON result_cache (created_at)"
+            )
+            conn.commit()
+            _disk_ready = True
+    _local.conn = conn
+    return conn
+
+
+def _disk_get(key: str, data_version: str) -> str | None:
+    try:
+        row = _get_disk_conn().execute(
+            "SELECT result FROM result_cache WHERE key = ? AND data_version = ?",
+            (key, data_version),
+        ).fetchone()
+    except sqlite3.Error:
+        _disk_stats["errors"] += 1
+        return None
+    if row is None:
+        _disk_stats["misses"] += 1
+        return None
+    _disk_stats["hits"] += 1
+    return row[0]
+
+
+def _disk_set(key: str, data_version: str, result: str) -> None:
+    try:
+        conn = _get_disk_conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO result_cache (key, data_version, result, created_at) "
+            "VALUES (?, ?, ?, ?)",
+            (key, data_version, result, time.time()),
+        )
+        _disk_stats["writes"] += 1
+        if _disk_stats["writes"] % 100 == 0:
+            conn.execute(
+                "DELETE FROM result_cache WHERE data_version != ? OR key IN ("
+                "SELECT key FROM result_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (data_version, settings.result_cache_disk_max_entries),
+            )
+        conn.commit()
+    except sqlite3.Error:
+        _disk_stats["errors"] += 1
+
+
+def lookup(key: str, data_version: str) -> str | None:
+    result = _memory.get((key, data_version))
+    if result is not None or not settings.result_cache_disk_enabled:
+        return result
+    result = _disk_get(key, data_version)
+    if result is not None:
+        _memory.set((key, data_version), result)
+    return result
+
+
+def store(key: str, data_version: str, result: str) -> None:
+    _memory.set((key, data_version), result)
+    if settings.result_cache_disk_enabled:
+        _disk_set(key, data_version, result)
+
+
+def stats() -> dict[str, Any]:
+    return {"memory": _memory.stats(), "disk": dict(_disk_stats)}
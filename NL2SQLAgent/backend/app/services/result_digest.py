@@ -0,0 +1,111 @@
+"""查询结果摘要：结果较大时用统计摘要代替原始行注入 LLM prompt，压缩 token 与首字延迟。
+
+统计按列计算：先把行转置为列数组，再对每列整体求 min / max / sum / 频次。
+"""
+from __future__ import annotations
+
+from collections import Counter
+from typing import Any, Sequence
+
+from app.config import settings
+from app.services import result_format
+from app.services.chart_rules import classify_columns
+
+
+def _fmt(value: Any) -> str:
+    """浮点数用定点格式（整数不带小数，|x|<1 保留 4 位，其余 2 位），避免科学计数法让 LLM 复述失真的数字。"""
+    if isinstance(value, float):
+        if value.is_integer():
+            return f"{value:,.0f}"
+        text = f"{value:,.4f}" if abs(value) < 1 else f"{value:,.2f}"
+        return text.rstrip("0").rstrip(".")
+    return str(value)
+
+
+def _numeric_stats(name: str, col_type: str, values: Sequence[Any]) -> str:
+    present = [v for v in values if v is not None]
+    nulls = len(values) - len(present)
+    if not present:
+        return f"- {name} ({col_type}): 全部为空"
+    total = sum(present)
+    return (
+        f"- {name} ({col_type}): min={_fmt(min(present))}, max={_fmt(max(present))}, "
+        f"mean={_fmt(total / len(present))}, sum={_fmt(total)}, 空值={nulls}"
+    )
+
+
+def _category_stats(name: str, col_type: str, values: Sequence[Any], top_k: int) -> str:
+    counts = Counter(values)
+    top = ", ".join(f"{_fmt(v)}({n})" for v, n in counts.most_common(top_k))
+    return f"- {name} ({col_type}): {len(counts)} 个不同取值, Top{min(top_k, len(counts))}: {top}"
+
+
+def _trend(x_name: str, x_values: Sequence[Any], y_name: str, y_values: Sequence[Any]) -> str | None:
+    totals: dict[Any, Any] = {}
+    for x, y in zip(x_values, y_values):
+        if x is not None and y is not None:
+            totals[x] = totals.get(x, 0) + y  # 同一时间点多行时按和聚合
+    if len(totals) < 3:
+        return None
+    points = sorted(totals.items(), key=lambda p: p[0])
+    first, last = points[0][1], points[-1][1]
+    ys = [p[1] for p in points]
+    peak = max(points, key=lambda p: p[1])
+    trough = min(points, key=lambda p: p[1])
+    rises = sum(1 for a, b in zip(ys, ys[1:]) if b > a)
+    falls = sum(1 for a, b in zip(ys, ys[1:]) if b < a)
+    if rises == len(ys) - 1:
+        direction = "持续上升"
+    elif falls == len(ys) - 1:
+        direction = "持续下降"
+    else:
+        direction = f"波动（{rises} 次上升 / {falls} 次下降）"
+    change = f"（{(last - first) / first:+.1%}）" if first else ""
+    return (
+        f"- {y_name} 随 {x_name}: 从 {_fmt(first)} 到 {_fmt(last)}{change}，{direction}；"
+        f"峰值 {_fmt(peak[0])}={_fmt(peak[1])}，谷值 {_fmt(trough[0])}={_fmt(trough[1])}"
+    )
+
+
+def summarize(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> str:
+    """生成结果的文本摘要：行列数、逐列统计、时间趋势与首尾示例行。"""
+    types = result_format.infer_column_types(columns, rows)
+    column_values = [list(col) for col in zip(*rows)] if rows else [[] for _ in columns]
+    groups = classify_columns(columns, rows)
+    top_k = settings.digest_top_k
+
+    lines = [f"结果共 {len(rows)} 行、{len(columns)} 列，以下为统计摘要（非完整数据）。", "", "列统计:"]
+    for name, col_type, values in zip(columns, types, column_values):
+        if name in groups["numeric"]:
+            lines.append(_numeric_stats(name, col_type, values))
+        else:
+            lines.append(_category_stats(name, col_type, values, top_k))
+
+    trends = []
+    index = {name: i for i, name in enumerate(columns)}
+    for x_name in groups["temporal"][:1]:
+        for y_name in groups["numeric"][: settings.digest_max_trends]:
+            trend = _trend(x_name, column_values[index[x_name]], y_name, column_values[index[y_name]])
+            if trend:
+                trends.append(trend)
+    if trends:
+        lines += ["", "趋势:", *trends]
+
+    sample = settings.digest_sample_rows
+    lines += ["", f"前 {min(sample, len(rows))} 行:", result_format.encode(columns, rows[:sample], "columnar", types)]
+    if len(rows) > sample * 2:
+        lines += [f"后 {sample} 行:", result_format.encode(columns, rows[-sample:], "columnar", types)]
+    return "\n".join(lines)
+
+
+def prepare_for_prompt(query_result: str) -> str:
+    """结果超过阈值时返回统计摘要，否则按 prompt_result_format 返回完整结果。"""
+    if not query_result:
+        return query_result
+    full = result_format.convert(query_result, settings.prompt_result_format)
+    if len(full) <= settings.digest_min_chars:
+        return full
+    columns, rows = result_format.decode(query_result)
+    if len(rows) <= settings.digest_min_rows:
+        return full
+    return summarize(columns, rows)
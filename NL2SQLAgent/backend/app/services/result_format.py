@@ -0,0 +1,71 @@
+"""查询结果编码：rows（对象数组）与 columnar（列名 + 类型 + 二维数组）互转。
+
+rows:     [{"region": "华东", "total": 1.0}, ...]
+columnar: {"columns": ["region", "total"], "types": ["text", "real"], "data": [["华东", 1.0], ...]}
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Literal, Sequence
+
+ResultFormat = Literal["rows", "columnar"]
+
+
+def infer_column_types(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> list[str]:
+    """按每列首个非空值推断类型：integer / real / text / blob / null。"""
+    types = []
+    for i in range(len(columns)):
+        col_type = "null"
+        for row in rows:
+            value = row[i]
+            if value is None:
+                continue
+            if isinstance(value, int):
+                col_type = "integer"
+            elif isinstance(value, float):
+                col_type = "real"
+            elif isinstance(value, bytes):
+                col_type = "blob"
+            else:
+                col_type = "text"
+            break
+        types.append(col_type)
+    return types
+
+
+def encode(
+    columns: Sequence[str],
+    rows: Sequence[Sequence[Any]],
+    fmt: ResultFormat = "rows",
+    types: Sequence[str] | None = None,
+) -> str:
+    if fmt == "columnar":
+        payload: Any = {
+            "columns": list(columns),
+            "types": list(types) if types is not None else infer_column_types(columns, rows),
+            "data": [list(r) for r in rows],
+        }
+    else:
+        payload = [dict(zip(columns, row)) for row in rows]
+    return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def decode(text: str) -> tuple[list[str], list[list[Any]]]:
+    """解析任一格式的结果字符串，返回 (columns, rows)。"""
+    payload = json.loads(text) if text else []
+    if isinstance(payload, dict):
+        return list(payload.get("columns", [])), [list(r) for r in payload.get("data", [])]
+    columns = list(payload[0].keys()) if payload else []
+    return columns, [[record.get(c) for c in columns] for record in payload]
+
+
+def detect(text: str) -> ResultFormat:
+    return "columnar" if text.lstrip().startswith("{") else "rows"
+
+
+def convert(text: str, fmt: ResultFormat) -> str:
+    """把结果字符串转换为目标格式，已是目标格式时原样返回。"""
+    if not text or detect(text) == fmt:
+        return text
+    columns, rows = decode(text)
+    return encode(columns, rows, fmt)
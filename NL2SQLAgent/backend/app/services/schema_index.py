@@ -0,0 +1,163 @@
+"""相关表检索：基于表名 / 列名 / 建表注释 / 示例取值的 BM25 词法索引。
+
+Schema 较大时，NL→SQL prompt 只注入与问题最相关的 top-k 张表及其外键邻居。
+索引持久化为 JSON 文件，表结构指纹（sqlite_master 的哈希）变化时自动重建。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+from app.config import settings
+from app.services.db_service import get_schema_fingerprint, readonly_connection
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"[A-Za-z]+|\d+|[一-鿿]+")
+_CAMEL_RE = re.compile(r"(?<=[a-z])(?=[A-Z])")
+_COMMENT_RE = re.compile(r"--([^\n]*)|/\*([\s\S]*?)\*/")
+
+_index: dict[str, Any] | None = None
+_lock = threading.Lock()
+
+
+def tokenize(text: str) -> list[str]:
+    """英文按单词（拆分下划线与驼峰）切分，中文输出单字与相邻二元组。"""
+    tokens: list[str] = []
+    for word in _WORD_RE.findall(_CAMEL_RE.sub(" ", text)):
+        if "一" <= word[0] <= "鿿":
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+
+def _collect_documents() -> tuple[dict[str, list[str]], dict[str, list[str]]]:
+    """为每张表构造检索文本，并收集外键邻接关系（双向）。"""
+    docs: dict[str, list[str]] = {}
+    neighbours: dict[str, set[str]] = {}
+    with readonly_connection() as conn:
+        tables = conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()
+        for table_name, create_sql in tables:
+            parts = [table_name, table_name]  # 表名权重加倍
+            for _, col_name, col_type, *_ in conn.execute(f"PRAGMA table_info('{table_name}')"):
+                parts += [col_name, col_type or ""]
+                if (col_type or "").upper().startswith(("TEXT", "VARCHAR", "CHAR")):
+                    values = conn.execute(
+                        f'SELECT DISTINCT "{col_name}" FROM "{table_name}" '
+                        f'WHERE "{col_name}" IS NOT NULL LIMIT ?',
+                        (settings.schema_index_sample_values,),
+                    ).fetchall()
+                    parts += [str(v[0]) for v in values]
+            for m in _COMMENT_RE.finditer(create_sql or ""):
+                parts.append(m.group(1) or m.group(2) or "")
+            docs[table_name] = tokenize(" ".join(parts))
+
+            neighbours.setdefault(table_name, set())
+            for fk in conn.execute(f"PRAGMA foreign_key_list('{table_name}')"):
+                ref = fk[2]
+                neighbours[table_name].add(ref)
+                neighbours.setdefault(ref, set()).add(table_name)
+    return docs, {k: sorted(v) for k, v in neighbours.items()}
+
+
+def _index_version() -> list[Any]:
+    # 只跟随结构变化；示例取值随数据变化带来的偏差可以接受，不值得每次写入都重建。
+    # schema_version 只是修改计数，同一路径换成另一个库时可能相同，因此用建表语句的哈希
+    return [settings.sample_db_path, get_schema_fingerprint()]
+
+
+def build_index() -> dict[str, Any]:
+    docs, neighbours = _collect_documents()
+    term_freqs = {name: dict(Counter(tokens)) for name, tokens in docs.items()}
+    doc_freq: Counter[str] = Counter()
+    for tf in term_freqs.values():
+        doc_freq.update(tf.keys())
+    lengths = {name: len(tokens) for name, tokens in docs.items()}
+    return {
+        "schema_version": _index_version(),
+        "term_freqs": term_freqs,
+        "doc_freq": dict(doc_freq),
+        "lengths": lengths,
+        "avg_length": (sum(lengths.values()) / len(lengths)) if lengths else 0.0,
+        "neighbours": neighbours,
+    }
+
+
+def _load_persisted(version: list[Any]) -> dict[str, Any] | None:
+    path = Path(settings.schema_index_path)
+    if not path.exists():
+        return None
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    return data if data.get("schema_version") == version else None
+
+
+def get_index() -> dict[str, Any]:
+    """返回与当前 Schema 版本一致的索引：内存 → 持久化文件 → 重建。"""
+    global _index
+    version = _index_version()
+    with _lock:
+        if _index is not None and _index["schema_version"] == version:
+            return _index
+        index = _load_persisted(version)
+        if index is None:
+            index = build_index()
+            try:
+                Path(settings.schema_index_path).write_text(
+                    json.dumps(index, ensure_ascii=False), encoding="utf-8"
+                )
+            except OSError as e:
+                logger.warning(f"Failed to persist schema index: {e}")
+        _index = index
+        return index
+
+
+def table_count() -> int:
+    return len(get_index()["lengths"])
+
+
+def select_tables(question: str, top_k: int | None = None) -> list[str] | None:
+    """返回与问题最相关的 top-k 张表及其外键邻居；无任何词项命中时返回 None。"""
+    index = get_index()
+    top_k = top_k or settings.schema_retrieval_top_k
+    n_docs = len(index["lengths"])
+    avg_length = index["avg_length"] or 1.0
+    query_terms = set(tokenize(question))
+
+    scores: dict[str, float] = {}
+    for term in query_terms:
+        df = index["doc_freq"].get(term)
+        if not df:
+            continue
+        idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        for table, tf in index["term_freqs"].items():
+            freq = tf.get(term)
+            if not freq:
+                continue
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * index["lengths"][table] / avg_length)
+            scores[table] = scores.get(table, 0.0) + idf * freq * (BM25_K1 + 1) / (freq + norm)
+
+    if not scores:
+        return None
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    selected = list(ranked)
+    for table in ranked:
+        for neighbour in index["neighbours"].get(table, []):
+            if neighbour not in selected:
+                selected.append(neighbour)
+    return selected
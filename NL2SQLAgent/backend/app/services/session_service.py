@@ -1,12 +1,39 @@
 from __future__ import annotations
 
+import base64
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from sqlalchemy import delete, select, update
+from sqlalchemy import and_, delete, func, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 
-from app.models.database import Message, Session
+from app.config import settings
+from app.models.database import Message, Session, generate_uuid
+from app.services import result_format
+
+
+def _encode_query_result(query_result: str | None) -> str | None:
+    """入库前统一转换为 settings.result_storage_format，读取时由调用方按需转换。"""
+    if not query_result:
+        return query_result
+    return result_format.convert(query_result, settings.result_storage_format)
+
+
+def encode_cursor(timestamp: datetime, row_id: str) -> str:
+    """把 (时间戳, id) 编码为不透明的分页游标。"""
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """解析分页游标，格式非法时抛出 ValueError。"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        timestamp, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), row_id
+    except (UnicodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
 
 
 async def create_session(db: AsyncSession, title: str = "新对话") -> Session:
@@ -19,11 +46,64 @@ async def create_session(db: AsyncSession, title: str = "新对话") -> Session:
 
 async def list_sessions(db: AsyncSession) -> list[Session]:
     result = await db.execute(
-        select(Session).order_by(Session.updated_at.desc())
+        select(Session).order_by(Session.updated_at.desc(), Session.id.desc())
     )
     return list(result.scalars().all())
 
 
+async def list_session_page(
+    db: AsyncSession,
+    limit: int | None,
+    cursor: str | None = None,
+    with_summary: bool = False,
+) -> tuple[list[dict], str | None]:
+    """按 (updated_at, id) 键集分页列出会话，最近更新的在前。
+
+    limit 为 None 时不分页；with_summary 为 True 时在同一条查询中附带消息数与最后一条消息的预览。
+    返回 (会话字典列表, 下一页游标)。
+    """
+    columns = [Session.id, Session.title, Session.created_at, Session.updated_at]
+    if with_summary:
+        message_count = (
+            select(func.count())
+            .where(Message.session_id == Session.id)
+            .correlate(Session)
+            .scalar_subquery()
+        )
+        last_message = (
+            select(func.substr(Message.content, 1, settings.session_preview_chars))
+            .where(Message.session_id == Session.id, Message.content != "")
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(1)
+            .correlate(Session)
+            .scalar_subquery()
+        )
+        columns += [
+            message_count.label("message_count"),
+            last_message.label("last_message_preview"),
+        ]
+
+    stmt = select(*columns)
+    if cursor:
+        updated_at, session_id = decode_cursor(cursor)
+        stmt = stmt.where(
+            or_(
+                Session.updated_at < updated_at,
+                and_(Session.updated_at == updated_at, Session.id < session_id),
+            )
+        )
+    stmt = stmt.order_by(Session.updated_at.desc(), Session.id.desc())
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+    result = await db.execute(stmt)
+    rows = [dict(row) for row in result.mappings().all()]
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["updated_at"], rows[-1]["id"])
+    return rows, next_cursor
+
+
 async def get_session(db: AsyncSession, session_id: str) -> Session | None:
     result = await db.execute(select(Session).where(Session.id == session_id))
     return result.scalar_one_or_none()
@@ -40,11 +120,54 @@ async def get_messages(db: AsyncSession, session_id: str) -> list[Message]:
     result = await db.execute(
         select(Message)
         .where(Message.session_id == session_id)
-        .order_by(Message.created_at.asc())
+        .order_by(Message.created_at.asc(), Message.id.asc())
     )
     return list(result.scalars().all())
 
 
+async def get_message_page(
+    db: AsyncSession,
+    session_id: str,
+    limit: int,
+    before: str | None = None,
+) -> tuple[list[Message], str | None]:
+    """按 (created_at, id) 键集分页，从最新消息向前翻页。
+
+    返回按时间正序排列的一页消息，以及用于加载更早消息的游标（没有更多时为 None）。
+    """
+    stmt = select(Message).where(Message.session_id == session_id)
+    if before:
+        created_at, message_id = decode_cursor(before)
+        stmt = stmt.where(
+            or_(
+                Message.created_at < created_at,
+                and_(Message.created_at == created_at, Message.id < message_id),
+            )
+        )
+    result = await db.execute(
+        stmt.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1)
+    )
+    messages = list(result.scalars().all())
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_cursor = encode_cursor(messages[-1].created_at, messages[-1].id)
+    messages.reverse()
+    return messages, next_cursor
+
+
+async def get_recent_messages(db: AsyncSession, session_id: str, limit: int) -> list[Message]:
+    """读取最近 limit 条消息（正序），只加载构建对话记忆所需的列。"""
+    result = await db.execute(
+        select(Message)
+        .options(load_only(Message.role, Message.content, Message.sql_query, Message.created_at))
+        .where(Message.session_id == session_id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(limit)
+    )
+    return list(reversed(result.scalars().all()))
+
+
 async def add_message(
     db: AsyncSession,
     session_id: str,
@@ -59,7 +182,7 @@ async def add_message(
         role=role,
         content=content,
         sql_query=sql_query,
-        query_result=query_result,
+        query_result=_encode_query_result(query_result),
         chart_config=json.dumps(chart_config, ensure_ascii=False) if chart_config else None,
     )
     db.add(msg)
@@ -74,23 +197,77 @@ async def add_message(
     return msg
 
 
-async def update_message(
+async def start_turn(
     db: AsyncSession,
-    message_id: str,
+    session: Session,
+    content: str,
+    title_length: int = 30,
+) -> tuple[Message, Message]:
+    """在同一事务中写入用户消息与空的助手占位消息、刷新 updated_at，并为新会话生成标题。
+
+    主键在客户端生成，提交后无需 refresh；助手消息时间戳比用户消息晚 1 微秒以保证排序稳定。
+    """
+    now = datetime.utcnow()
+    user_msg = Message(
+        id=generate_uuid(),
+        session_id=session.id,
+        role="user",
+        content=content,
+        created_at=now,
+    )
+    ai_msg = Message(
+        id=generate_uuid(),
+        session_id=session.id,
+        role="assistant",
+        content="",
+        created_at=now + timedelta(microseconds=1),
+    )
+    db.add_all([user_msg, ai_msg])
+
+    # 直接改 ORM 属性，提交后调用方可读到新的 updated_at 作为会话记忆版本
+    session.updated_at = now
+    if session.title == "新对话":
+        session.title = content[:title_length] + ("..." if len(content) > title_length else "")
+    await db.commit()
+    return user_msg, ai_msg
+
+
+def _message_values(
     content: str | None = None,
     sql_query: str | None = None,
     query_result: str | None = None,
     chart_config: dict | None = None,
-) -> None:
+) -> dict:
     values: dict = {}
     if content is not None:
         values["content"] = content
     if sql_query is not None:
         values["sql_query"] = sql_query
     if query_result is not None:
-        values["query_result"] = query_result
+        values["query_result"] = _encode_query_result(query_result)
     if chart_config is not None:
         values["chart_config"] = json.dumps(chart_config, ensure_ascii=False)
+    return values
+
+
+async def update_message(
+    db: AsyncSession,
+    message_id: str,
+    content: str | None = None,
+    sql_query: str | None = None,
+    query_result: str | None = None,
+    chart_config: dict | None = None,
+) -> None:
+    values = _message_values(content, sql_query, query_result, chart_config)
     if values:
         await db.execute(update(Message).where(Message.id == message_id).values(**values))
         await db.commit()
+
+
+async def update_messages(db: AsyncSession, updates: list[tuple[str, dict]]) -> None:
+    """批量更新多条消息，统一在一个事务中提交。updates 为 (message_id, update_message 关键字参数)。"""
+    for message_id, fields in updates:
+        values = _message_values(**fields)
+        if values:
+            await db.execute(update(Message).where(Message.id == message_id).values(**values))
+    await db.commit()
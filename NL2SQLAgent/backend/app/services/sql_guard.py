@@ -0,0 +1,229 @@
+"""SQL 安全校验：先词法切分再按语句结构判断，只放行单条只读 SELECT（含 WITH CTE）。
+
+字符串、带引号标识符和注释在词法层面被隔离，因此 REPLACE() 函数、update_time 之类的列名
+不会被误判；校验结论按去掉字面量后的 SQL 指纹缓存。
+"""
+from __future__ import annotations
+
+import re
+from typing import NamedTuple
+
+from app.config import settings
+from app.services.cache import LRUCache
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+)
+    |(?P<comment>--[^\n]*|/\*[\s\S]*?(?:\*/|\Z))
+    |(?P<blob>[xX]'[0-9A-Fa-f]*')
+    |(?P<string>'(?:[^']|'')*')
+    |(?P<ident>"(?:[^"]|"")*"|`(?:[^`]|``)*`|\[[^\]]*\])
+    |(?P<number>0[xX][0-9A-Fa-f]+|(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)
+    |(?P<param>\?\d*|[:@$][A-Za-z_]\w*)
+    |(?P<word>[A-Za-z_\u0080-\uffff][\w$\u0080-\uffff]*)
+    |(?P<op>\|\||->>|->|<<|>>|<=|>=|==|!=|<>|[-+*/%&|~<>=(),.;])
+    """,
+    re.VERBOSE,
+)
+
+_LITERALS = {"string", "blob", "number", "param"}
+
+# SQLite 保留字，不能作为未加引号的标识符出现，一旦出现即为写操作
+_WRITE_KEYWORDS = {"INSERT", "UPDATE", "DELETE", "DROP", "CREATE", "ALTER"}
+
+# 可读写文件或加载扩展的函数
+_FORBIDDEN_FUNCTIONS = {"load_extension", "readfile", "writefile", "edit", "fts3_tokenizer"}
+
+_ERR_WRITE = "SQL 包含危险操作，仅允许 SELECT 查询"
+_ERR_NOT_SELECT = "仅允许 SELECT 查询语句"
+
+# FROM / JOIN 之后紧跟的这些关键字不是表别名
+_NOT_ALIAS = {
+    "WHERE", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "OUTER",
+    "ON", "USING", "GROUP", "ORDER", "LIMIT", "HAVING", "WINDOW", "UNION", "EXCEPT",
+    "INTERSECT", "INDEXED", "NOT",
+}
+
+_OK = ""  # LRUCache 以 None 表示未命中，安全结论用空串缓存
+
+_verdicts: LRUCache[str] = LRUCache(max_entries=settings.sql_guard_cache_size)
+
+
+class Token(NamedTuple):
+    kind: str
+    value: str
+
+
+class SQLSyntaxError(ValueError):
+    """SQL 中存在无法识别的字符。"""
+
+
+def tokenize(sql: str) -> list[Token]:
+    """切分为词法单元，丢弃空白与注释。"""
+    tokens: list[Token] = []
+    pos = 0
+    while pos < len(sql):
+        m = _TOKEN_RE.match(sql, pos)
+        if m is None:
+            raise SQLSyntaxError(f"无法解析的 SQL 片段: {sql[pos:pos + 20]!r}")
+        kind = m.lastgroup
+        if kind not in ("ws", "comment"):
+            tokens.append(Token(kind, m.group()))
+        pos = m.end()
+    return tokens
+
+
+def fingerprint(sql: str | list[Token]) -> str:
+    """字面量替换为 ?、关键字统一大写后的语句文本，同构查询共享同一指纹。"""
+    tokens = tokenize(sql) if isinstance(sql, str) else sql
+    parts = []
+    for tok in tokens:
+        if tok.kind in _LITERALS:
+            parts.append("?")
+        elif tok.kind == "word":
+            parts.append(tok.value.upper())
+        else:
+            parts.append(tok.value)
+    return " ".join(parts).rstrip(" ;")
+
+
+def identifier(tok: Token) -> str | None:
+    if tok.kind == "word":
+        return tok.value
+    if tok.kind == "ident":
+        return tok.value[1:-1]
+    return None
+
+
+def table_aliases(tokens: list[Token], tables: set[str]) -> dict[str, str]:
+    """从 FROM / JOIN 子句收集 别名 -> 表名，执行计划中带别名的表以别名显示。"""
+    lookup = {t.lower(): t for t in tables}
+    aliases: dict[str, str] = {}
+    for i in range(1, len(tokens)):
+        name = identifier(tokens[i])
+        if name is None or name.lower() not in lookup:
+            continue
+        prev = tokens[i - 1].value.upper()
+        if prev not in ("FROM", "JOIN", ","):
+            continue
+        j = i + 1
+        if j < len(tokens) and tokens[j].kind == "word" and tokens[j].value.upper() == "AS":
+            j += 1
+        alias = identifier(tokens[j]) if j < len(tokens) else None
+        if alias and alias.upper() not in _NOT_ALIAS:
+            aliases[alias.lower()] = lookup[name.lower()]
+    return aliases
+
+
+def _split_statements(tokens: list[Token]) -> list[list[Token]]:
+    statements: list[list[Token]] = [[]]
+    for tok in tokens:
+        if tok == Token("op", ";"):
+            statements.append([])
+        else:
+            statements[-1].append(tok)
+    return [s for s in statements if s]
+
+
+def _skip_parens(tokens: list[Token], i: int) -> int:
+    """tokens[i] 为左括号，返回与之匹配的右括号之后的位置。"""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j] == Token("op", "("):
+            depth += 1
+        elif tokens[j] == Token("op", ")"):
+            depth -= 1
+            if depth == 0:
+                return j + 1
+    raise SQLSyntaxError("括号不匹配")
+
+
+def _is_word(tokens: list[Token], i: int, *words: str) -> bool:
+    return i < len(tokens) and tokens[i].kind == "word" and tokens[i].value.upper() in words
+
+
+def _check_select(tokens: list[Token], allow_values: bool = False) -> str | None:
+    """校验一条查询：可选的 WITH 子句之后必须是 SELECT（CTE 体内也允许 VALUES）。"""
+    i = 0
+    if _is_word(tokens, i, "WITH"):
+        i += 1
+        if _is_word(tokens, i, "RECURSIVE"):
+            i += 1
+        while True:
+            # cte_name [(col, ...)] AS [[NOT] MATERIALIZED] (select)
+            if i >= len(tokens) or tokens[i].kind not in ("word", "ident"):
+                return _ERR_NOT_SELECT
+            i += 1
+            if i < len(tokens) and tokens[i] == Token("op", "("):
+                i = _skip_parens(tokens, i)
+            if not _is_word(tokens, i, "AS"):
+                return _ERR_NOT_SELECT
+            i += 1
+            if _is_word(tokens, i, "NOT"):
+                i += 1
+            if _is_word(tokens, i, "MATERIALIZED"):
+                i += 1
+            if i >= len(tokens) or tokens[i] != Token("op", "("):
+                return _ERR_NOT_SELECT
+            end = _skip_parens(tokens, i)
+            error = _check_select(tokens[i + 1:end - 1], allow_values=True)
+            if error:
+                return error
+            i = end
+            if i < len(tokens) and tokens[i] == Token("op", ","):
+                i += 1
+                continue
+            break
+
+    heads = ("SELECT", "VALUES") if allow_values else ("SELECT",)
+    if _is_word(tokens, i, *heads):
+        return None
+    if i < len(tokens) and tokens[i].value.upper() in _WRITE_KEYWORDS | {"REPLACE"}:
+        return _ERR_WRITE
+    return _ERR_NOT_SELECT
+
+
+def _validate(tokens: list[Token]) -> str | None:
+    statements = _split_statements(tokens)
+    if not statements:
+        return "SQL 为空"
+    if len(statements) > 1:
+        return "不允许执行多条 SQL 语句"
+    stmt = statements[0]
+
+    for i, tok in enumerate(stmt):
+        name = identifier(tok)
+        if name is None:
+            continue
+        is_call = i + 1 < len(stmt) and stmt[i + 1] == Token("op", "(")
+        qualified = (i > 0 and stmt[i - 1] == Token("op", ".")) or (
+            i + 1 < len(stmt) and stmt[i + 1] == Token("op", ".")
+        )
+        # SQLite 也接受带引号的函数名，如 "load_extension"('x')
+        if is_call and name.lower() in _FORBIDDEN_FUNCTIONS:
+            return f"不允许调用函数 {name}"
+        if tok.kind == "word" and not is_call and not qualified and name.upper() in _WRITE_KEYWORDS:
+            return _ERR_WRITE
+
+    return _check_select(stmt)
+
+
+def check(sql: str) -> str | None:
+    """安全返回 None，否则返回错误描述。"""
+    try:
+        tokens = tokenize(sql)
+        key = fingerprint(tokens)
+    except SQLSyntaxError as e:
+        return str(e)
+    verdict = _verdicts.get(key)
+    if verdict is None:
+        try:
+            verdict = _validate(tokens) or _OK
+        except SQLSyntaxError as e:
+            verdict = str(e)
+        _verdicts.set(key, verdict)
+    return verdict or None
+
+
+def stats() -> dict:
+    return _verdicts.stats()
@@ -114,6 +114,8 @@ def main():
     try:
         create_tables(conn)
         seed_data(conn)
+        conn.execute("ANALYZE")  # 生成 sqlite_stat1，供表目录估算行数
+        conn.commit()
         count = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
         print(f"sample.db 初始化完成: {len(PRODUCTS)} 个产品, 50 个客户, {count} 条订单")
     finally:
@@ -228,15 +228,18 @@ export const useAppStore = create<AppState>((set, get) => ({
         }))
       },
       onChart: (chart) => {
+        // 图表与回答并发生成，可能先于回答到达：只更新图表步骤，不结束仍在进行的回答步骤
+        const now = Date.now()
         set((s) => ({
           messages: patchLastAI(s.messages, (m) => ({
             ...m,
             chart_config: chart,
-            thinkingSteps: updateStep(
-              advanceToStep(m.thinkingSteps ?? [], 'chart'),
-              'chart',
-              { status: 'done', doneAt: Date.now(), detail: `${chart.chartType} 图表` },
-            ),
+            thinkingSteps: updateStep(m.thinkingSteps ?? [], 'chart', {
+              status: 'done',
+              startedAt: now,
+              doneAt: now,
+              detail: `${chart.chartType} 图表`,
+            }),
           })),
           charts: [...s.charts, chart],
         }))